@@ -0,0 +1,288 @@
+import os
+import random
+import threading
+import time
+from metrics import registry
+
+DEFAULT_API_ROOT = 'https://aihub.instabase.com/api'
+
+# Defaults for the process-wide limiter; AIHUB_REQUESTS_PER_SECOND, AIHUB_BURST and
+# AIHUB_MAX_CONCURRENT_CALLS override them when the client is created
+DEFAULT_REQUESTS_PER_SECOND = 10.0
+DEFAULT_BURST = 20
+DEFAULT_MAX_CONCURRENT_CALLS = 16
+
+# HTTP statuses worth retrying; everything else (bad request, auth...) fails straight away
+TRANSIENT_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+aihub_calls = registry.counter('aihub_calls_total', 'AIHub calls by method and outcome')
+aihub_seconds = registry.histogram('aihub_call_seconds', 'Latency of individual AIHub calls')
+limiter_wait_seconds = registry.histogram('aihub_rate_limit_wait_seconds', 'Time spent waiting for the rate limiter')
+
+# Calls that create something on AIHub: after a read timeout the request may already have
+# been processed, so these are only retried when it certainly never reached the server
+NON_IDEMPOTENT_METHODS = {'run', 'create', 'add_documents', 'converse'}
+# Calls that start new (billed) work. Only these are refused while the circuit is open, so
+# queries and conversations already running on AIHub can still be polled to completion.
+SHED_METHODS = {'run', 'create', 'converse'}
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+def is_transient(error):
+    # Classify an exception from the AIHub SDK: throttling, server errors and
+    # connection problems are transient, anything else is not
+    status = getattr(error, 'status', None)
+    if isinstance(status, int):
+        return status in TRANSIENT_STATUSES
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import urllib3  # Already loaded by the SDK whenever there is an error to classify
+    except ImportError:
+        return False
+    return isinstance(error, urllib3.exceptions.HTTPError)
+
+def is_connect_error(error):
+    # Failures before the request was accepted: connection refused/not established, or throttled
+    status = getattr(error, 'status', None)
+    if isinstance(status, int):
+        return status == 429
+    if isinstance(error, ConnectionRefusedError):
+        return True
+    try:
+        import urllib3  # Already loaded by the SDK whenever there is an error to classify
+    except ImportError:
+        return False
+    if isinstance(error, urllib3.exceptions.MaxRetryError):
+        error = error.reason
+    return isinstance(error, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
+
+class TokenBucket:
+    # Allows `rate` requests per second on average with bursts of up to `burst`
+    def __init__(self, rate=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class CallLimit:
+    # Caps the number of calls in flight; unlike a semaphore the cap can be changed later
+    def __init__(self, limit=DEFAULT_MAX_CONCURRENT_CALLS):
+        self.limit = limit
+        self._active = 0
+        self._cond = threading.Condition()
+
+    def set_limit(self, limit):
+        with self._cond:
+            self.limit = limit
+            self._cond.notify_all()
+
+    def __enter__(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+
+    def __exit__(self, *exc_info):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+class CircuitBreaker:
+    # Opens after `failure_threshold` transient failures in a row and rejects calls
+    # for `reset_timeout` seconds; then lets one trial call through (half-open)
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("Error: AIHub is failing, requests are paused for a moment.")
+                self.state = 'half-open'
+            elif self.state == 'half-open':
+                # Only the trial call goes through until it succeeds or fails
+                raise CircuitOpenError("Error: AIHub is recovering, requests are paused for a moment.")
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half-open' or self._failures >= self.failure_threshold:
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+class RetryPolicy:
+    # Exponential backoff with full jitter for transient failures
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+class _Resource:
+    # Proxies client.queries / client.conversations, sending every call through the wrapper
+    def __init__(self, wrapper, resource):
+        self._wrapper = wrapper
+        self._resource = resource
+
+    def __getattr__(self, name):
+        attr = getattr(self._resource, name)
+        if not callable(attr):
+            return attr
+        return lambda *args, **kwargs: self._wrapper.call(attr, *args, **kwargs)
+
+class ResilientAIHub:
+    # Wraps an AIHub client with a rate limiter, a cap on concurrent calls, classified
+    # retries and a circuit breaker. Limiter and breaker are shared process-wide by default
+    # so every client in the CLI or the server draws from the same budget.
+    def __init__(self, client, limiter=None, breaker=None, retry=None, call_limit=None):
+        self.client = client
+        self.limiter = limiter or shared_limiter
+        self.breaker = breaker or shared_breaker
+        self.retry = retry or RetryPolicy()
+        self._calls = call_limit or shared_call_limit
+        self.queries = _Resource(self, client.queries)
+        self.conversations = _Resource(self, client.conversations)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def call(self, fn, *args, **kwargs):
+        method = getattr(fn, '__qualname__', getattr(fn, '__name__', 'call'))
+        idempotent = getattr(fn, '__name__', None) not in NON_IDEMPOTENT_METHODS
+        shed = getattr(fn, '__name__', None) in SHED_METHODS
+        attempt = 0
+        while True:
+            if shed:
+                self.breaker.before_call()
+            with limiter_wait_seconds.time():
+                self.limiter.acquire()
+            try:
+                with self._calls, aihub_seconds.time(method=method):
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    aihub_calls.inc(method=method, outcome='error')
+                    # AIHub answered (e.g. a 400), so it is reachable: this also ends a half-open trial
+                    self.breaker.record_success()
+                    raise
+                aihub_calls.inc(method=method, outcome='transient_error')
+                self.breaker.record_failure()
+                attempt += 1
+                if attempt >= self.retry.max_attempts or not (idempotent or is_connect_error(e)):
+                    raise
+                time.sleep(self.retry.delay(attempt))
+                continue
+            aihub_calls.inc(method=method, outcome='ok')
+            self.breaker.record_success()
+            return result
+
+def _pool_managers(obj, depth=5, seen=None):
+    # Find the urllib3 pool managers inside the generated SDK client
+    # (AIHub -> api resources -> ApiClient -> rest_client.pool_manager)
+    seen = set() if seen is None else seen
+    if depth < 0 or id(obj) in seen or isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return []
+    seen.add(id(obj))
+    found = []
+    if hasattr(obj, 'connection_pool_kw') and hasattr(obj, 'clear'):
+        return [obj]
+    try:
+        children = list(vars(obj).values())
+    except TypeError:
+        return []
+    for child in children:
+        found.extend(_pool_managers(child, depth - 1, seen))
+    return found
+
+def size_connection_pool(client, maxsize):
+    # Make the SDK keep up to `maxsize` connections per host, so concurrent calls
+    # reuse connections instead of opening and discarding extra ones
+    managers = _pool_managers(client)
+    for manager in managers:
+        manager.connection_pool_kw['maxsize'] = maxsize
+        manager.clear()  # Pools are recreated with the new size on next use
+    # The SDK keeps its generated ApiClient on AIHub.client
+    configuration = getattr(getattr(client, 'client', None), 'configuration', None)
+    if configuration is not None and hasattr(configuration, 'connection_pool_maxsize'):
+        configuration.connection_pool_maxsize = maxsize
+    return len(managers)
+
+shared_limiter = TokenBucket()
+shared_breaker = CircuitBreaker()
+shared_call_limit = CallLimit()
+_wrapped_clients = []
+
+def resilient(client):
+    size_connection_pool(client, shared_call_limit.limit)
+    wrapper = ResilientAIHub(client)
+    _wrapped_clients.append(wrapper)
+    return wrapper
+
+def configure_concurrency(concurrency):
+    # Let at least `concurrency` calls run at once and size every connection pool to match
+    limit = max(shared_call_limit.limit, concurrency)
+    shared_call_limit.set_limit(limit)
+    for wrapper in _wrapped_clients:
+        size_connection_pool(wrapper.client, limit)
+
+_client = None
+_client_lock = threading.Lock()
+_overrides = {}
+
+def configure_client(api_key=None, api_root=None, ib_context=None):
+    # Settings from the command line; they win over the environment. Must be called
+    # before the client is first used.
+    _overrides.update({k: v for k, v in (('api_key', api_key), ('api_root', api_root), ('ib_context', ib_context)) if v})
+
+def set_client(client):
+    # Use an already built client (e.g. a stand-in for benchmarks) for the whole process
+    global _client
+    with _client_lock:
+        _client = client
+
+def get_client():
+    # One connection-pooled client per process, built on first use so importing the
+    # CLI or the server does no config, SDK or network work
+    global _client
+    with _client_lock:
+        if _client is None:
+            from dotenv import load_dotenv
+            from aihub import AIHub
+
+            # Load environment variables from .env file
+            load_dotenv()
+            shared_limiter.rate = float(os.getenv('AIHUB_REQUESTS_PER_SECOND', shared_limiter.rate))
+            shared_limiter.burst = int(os.getenv('AIHUB_BURST', shared_limiter.burst))
+            shared_call_limit.set_limit(max(shared_call_limit.limit, int(os.getenv('AIHUB_MAX_CONCURRENT_CALLS', shared_call_limit.limit))))
+            _client = resilient(AIHub(
+                api_key=_overrides.get('api_key') or os.getenv('API_KEY'),
+                api_root=_overrides.get('api_root') or os.getenv('AIHUB_API_ROOT', DEFAULT_API_ROOT),
+                ib_context=_overrides.get('ib_context') or os.getenv('IB-CONTEXT')
+            ))
+        return _client
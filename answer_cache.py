@@ -0,0 +1,97 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from metrics import registry
+
+# The cache lives next to the code so the CLI and the Flask server share it
+DEFAULT_CACHE_DIR = os.getenv('AUTO_ORACLE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+DEFAULT_TTL = 30 * 24 * 60 * 60  # Cached answers expire after 30 days
+DEFAULT_MAX_ENTRIES = 10000  # Least recently used answers are evicted beyond this
+
+cache_lookups = registry.counter('answer_cache_lookups_total', 'Answer cache lookups by result')
+
+# Leading numbering needs a delimiter ("1.", "2)", "(3)", "Q4:") or, for "Q4"/"3.2" style
+# labels, a capitalized word after it, so "10 users supported?" keeps its number
+LEADING_NUMBERING = re.compile(
+    r'^\s*(?:(?i:q(?:uestion)?)\s*\d+(?:\.\d+)*(?:\s*[.):-]\s+|\s+(?=[A-Z]))'
+    r'|\(?\d+(?:\.\d+)*\s*[.):-]\s+'
+    r'|\d+(?:\.\d+)+\s+(?=[A-Z]))'
+)
+
+def normalize_question(question):
+    # Make trivially different phrasings of the same question share a key:
+    # unicode/case/whitespace differences, leading numbering and trailing punctuation
+    text = LEADING_NUMBERING.sub('', unicodedata.normalize('NFKC', question)).lower()
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip().rstrip('?.!:;').strip()
+
+class AnswerCache:
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, 'answers.sqlite3')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')  # Lets the CLI and the server use it at the same time
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS answers ('
+                ' chatbot_id TEXT NOT NULL, question_key TEXT NOT NULL, model_name TEXT NOT NULL,'
+                ' question TEXT NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL,'
+                ' PRIMARY KEY (chatbot_id, question_key, model_name))'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used_at)')
+
+    def get(self, chatbot_id, question, model_name):
+        key = (chatbot_id, normalize_question(question), model_name)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT answer, created_at FROM answers WHERE chatbot_id = ? AND question_key = ? AND model_name = ?', key
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute('DELETE FROM answers WHERE chatbot_id = ? AND question_key = ? AND model_name = ?', key)
+                row = None
+            if row is None:
+                self.misses += 1
+                cache_lookups.inc(result='miss')
+                return None
+            self._conn.execute(
+                'UPDATE answers SET last_used_at = ? WHERE chatbot_id = ? AND question_key = ? AND model_name = ?', (now,) + key
+            )
+            self.hits += 1
+            cache_lookups.inc(result='hit')
+            return row[0]
+
+    def put(self, chatbot_id, question, model_name, answer):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (chatbot_id, normalize_question(question), model_name, question, answer, now, now)
+            )
+            if self.max_entries is not None:
+                self._conn.execute(
+                    'DELETE FROM answers WHERE rowid IN'
+                    ' (SELECT rowid FROM answers ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,)
+                )
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    # Process-wide cache shared by every query in the CLI or the Flask server
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+        return _cache
@@ -0,0 +1,62 @@
+import threading
+import time
+from knowledge_base_query import submit_query
+from metrics import registry, start_span
+
+# Default cap on the number of questions being answered at the same time
+DEFAULT_CONCURRENCY = 4
+
+queue_wait_seconds = registry.histogram('queue_wait_seconds', 'Time a question waited for a free slot before being submitted')
+questions_total = registry.counter('questions_total', 'Questions answered, by outcome')
+
+def answer_questions(questions, chatbot_link, concurrency=DEFAULT_CONCURRENCY, submit_fn=submit_query, on_result=None):
+    # submit_fn(question, chatbot_link) sends a query and returns a Future for its answer.
+    # Results are stored by index so they stay in question order no matter
+    # which query finishes first
+    results = [None] * len(questions)
+    in_flight = threading.Semaphore(max(1, concurrency))
+    lock = threading.Lock()
+    finished = threading.Event()
+    remaining = [len(questions)]
+    spans = [None] * len(questions)
+    queued_at = time.perf_counter()
+
+    def record(index, question, answer=None, error=None):
+        # A failing question is recorded with its error instead of aborting the run
+        result = {'question': question, 'answer': answer, 'error': error}
+        questions_total.inc(outcome='ok' if error is None else 'error')
+        spans[index].end(error=error)
+        with lock:  # Callbacks (e.g. printing progress) run one at a time
+            results[index] = result
+            try:
+                if on_result is not None:
+                    on_result(index, result)
+            finally:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    finished.set()
+                in_flight.release()
+
+    def on_done(index, question, future):
+        # Only the query's own failure is caught here: record must run exactly once,
+        # even if on_result raises
+        try:
+            answer, error = future.result(), None
+        except Exception as e:
+            answer, error = None, str(e)
+        record(index, question, answer=answer, error=error)
+
+    for index, question in enumerate(questions):
+        in_flight.acquire()  # Wait until fewer than `concurrency` questions are outstanding
+        queue_wait_seconds.observe(time.perf_counter() - queued_at)
+        spans[index] = start_span('question', question_id=index + 1, question=question[:200])
+        try:
+            future = submit_fn(question, chatbot_link)
+        except Exception as e:
+            record(index, question, error=str(e))
+            continue
+        future.add_done_callback(lambda f, i=index, q=question: on_done(i, q, f))
+
+    if questions:
+        finished.wait()
+    return results
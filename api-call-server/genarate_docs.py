@@ -1,73 +1,462 @@
+import difflib
+import hashlib
+import html
+import io
+import json
+import os
+import re
+import struct
+import tempfile
 import zipfile
-from typing import List, Tuple
+import zlib
+from typing import IO, Callable, Iterable, Iterator, List, Optional, Tuple, Union
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
 
 from model_utils import DEFAULT_MODEL, get_llm_model
+from response_cache import ResponseCache, cache_key
+
+
+DOCUMENT_XML = 'word/document.xml'
+# Modified XML is encoded and written in pieces of this many characters
+WRITE_CHUNK_CHARS = 1024 * 1024
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+# ZIP record layouts (APPNOTE 4.3.7, 4.3.9, 4.3.12, 4.3.16). Members are written by hand so
+# untouched ones keep their compressed bytes: zipfile can only add a member by compressing it.
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_DATA_DESCRIPTOR = struct.Struct('<4sIII')
+_CENTRAL_HEADER = struct.Struct('<4sHHHHHHIIIHHHHHII')
+_END_OF_CENTRAL_DIR = struct.Struct('<4sHHHHIIH')
+_UTF8_FLAG = 0x800
+_DESCRIPTOR_FLAG = 0x08
+_ZIP32_LIMIT = 0xFFFFFFFF
+
+
+def _dos_date_time(date_time: Tuple[int, ...]) -> Tuple[int, int]:
+  year, month, day, hour, minute, second = date_time
+  return (max(year, 1980) - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+
+class _ZipWriter:
+  # Appends local entries to a binary stream and finishes with the central directory.
+  # Only counts bytes, so the output needn't be seekable.
+  def __init__(self, output: IO[bytes]) -> None:
+    self.output = output
+    self.offset = 0
+    self.central = []
+
+  def _write(self, data: bytes) -> None:
+    self.output.write(data)
+    self.offset += len(data)
+
+  def _name(self, info: zipfile.ZipInfo, flags: int) -> Tuple[bytes, int]:
+    try:
+      return info.filename.encode('ascii'), flags & ~_UTF8_FLAG
+    except UnicodeEncodeError:
+      return info.filename.encode('utf-8'), flags | _UTF8_FLAG
+
+  def _add_central(self, info: zipfile.ZipInfo, name: bytes, flags: int, method: int, crc: int,
+                   compress_size: int, file_size: int, header_offset: int) -> None:
+    if max(compress_size, file_size, header_offset) >= _ZIP32_LIMIT:
+      raise zipfile.LargeZipFile(f'{info.filename} needs ZIP64, which is not supported here')
+    date, time = _dos_date_time(info.date_time)
+    comment = info.comment or b''
+    self.central.append(_CENTRAL_HEADER.pack(
+      b'PK\x01\x02', info.create_system << 8 | 20, 20, flags, method, time, date, crc, compress_size, file_size,
+      len(name), 0, len(comment), 0, info.internal_attr, info.external_attr, header_offset
+    ) + name + comment)
+
+  def copy_raw(self, source_fp: IO[bytes], info: zipfile.ZipInfo) -> None:
+    # The member's compressed (or encrypted) bytes are copied as they are. The sizes and
+    # CRC go in the local header, so a data descriptor is only kept for encrypted members,
+    # whose password check byte depends on that flag.
+    source_fp.seek(info.header_offset)
+    header = _LOCAL_HEADER.unpack(source_fp.read(_LOCAL_HEADER.size))
+    if header[0] != b'PK\x03\x04':
+      raise zipfile.BadZipFile(f'Bad local header for {info.filename}')
+    source_fp.seek(header[9] + header[10], os.SEEK_CUR)
+    descriptor = info.flag_bits & 0x1 and info.flag_bits & _DESCRIPTOR_FLAG
+    name, flags = self._name(info, info.flag_bits if descriptor else info.flag_bits & ~_DESCRIPTOR_FLAG)
+    date, time = _dos_date_time(info.date_time)
+    header_offset = self.offset
+    self._add_central(info, name, flags, info.compress_type, info.CRC, info.compress_size, info.file_size, header_offset)
+    self._write(_LOCAL_HEADER.pack(b'PK\x03\x04', 20, flags, info.compress_type, time, date, info.CRC,
+                                   info.compress_size, info.file_size, len(name), 0) + name)
+    remaining = info.compress_size
+    while remaining > 0:
+      chunk = source_fp.read(min(COPY_CHUNK_BYTES, remaining))
+      if not chunk:
+        raise zipfile.BadZipFile(f'Truncated member {info.filename}')
+      self._write(chunk)
+      remaining -= len(chunk)
+    if descriptor:
+      self._write(_DATA_DESCRIPTOR.pack(b'PK\x07\x08', info.CRC, info.compress_size, info.file_size))
+
+  def write_deflated(self, info: zipfile.ZipInfo, chunks: Iterable[bytes]) -> None:
+    # Sizes and CRC are only known at the end, so they follow the data in a descriptor
+    name, flags = self._name(info, _DESCRIPTOR_FLAG)
+    date, time = _dos_date_time(info.date_time)
+    header_offset = self.offset
+    self._write(_LOCAL_HEADER.pack(b'PK\x03\x04', 20, flags, zipfile.ZIP_DEFLATED, time, date, 0, 0, 0, len(name), 0) + name)
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    crc, file_size, data_start = 0, 0, self.offset
+    for chunk in chunks:
+      crc = zlib.crc32(chunk, crc)
+      file_size += len(chunk)
+      self._write(compressor.compress(chunk))
+    self._write(compressor.flush())
+    compress_size = self.offset - data_start
+    self._add_central(info, name, flags, zipfile.ZIP_DEFLATED, crc, compress_size, file_size, header_offset)
+    self._write(_DATA_DESCRIPTOR.pack(b'PK\x07\x08', crc, compress_size, file_size))
+
+  def close(self, comment: bytes=b'') -> None:
+    start = self.offset
+    for record in self.central:
+      self._write(record)
+    if len(self.central) > 0xFFFF or start >= _ZIP32_LIMIT:
+      raise zipfile.LargeZipFile('The archive needs ZIP64, which is not supported here')
+    self._write(_END_OF_CENTRAL_DIR.pack(b'PK\x05\x06', 0, 0, len(self.central), len(self.central),
+                                         self.offset - start, start, len(comment)) + comment)
+
+
+def _replace_atomically(path: str, write: Callable[[IO[bytes]], None]) -> None:
+  # Write to a temporary file next to path and move it into place, so a failure
+  # part way through never leaves a truncated file behind
+  fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.part')
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      write(f)
+    os.replace(tmp_path, path)
+  finally:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
 
 
 class Docx:
   def __init__(self, filepath: str) -> None:
     self.filepath = filepath
     self.zipfile = zipfile.ZipFile(filepath)
-    self.content_xml = self.get_contnet_xml()
+    self._content = None
+
+  def __enter__(self) -> 'Docx':
+    return self
+
+  def __exit__(self, *exc_info) -> None:
+    self.close()
+
+  def close(self) -> None:
+    self.zipfile.close()
+
+  @property
+  def content_xml(self) -> str:
+    # Only read (and decode) document.xml when someone asks for it
+    if self._content is None:
+      self._content = self.get_contnet_xml()
+    elif not isinstance(self._content, str):
+      self._content = ''.join(self._content)
+    return self._content
 
   def get_contnet_xml(self) -> str:
-    filename = 'word/document.xml'
-    with self.zipfile.open(filename, 'r') as f:
+    with self.zipfile.open(DOCUMENT_XML, 'r') as f:
       return f.read().decode('utf-8')
     
-  def set_content_xml(self, content: str) -> None:
-    self.content_xml = content
-
-  def save(self, output_filepath: str) -> None:
-    with zipfile.ZipFile(output_filepath, 'w') as f:
-      for file in self.zipfile.filelist:
-        if file.filename == 'word/document.xml':
-          f.writestr(file, self.content_xml.encode('utf-8'))
+  def set_content_xml(self, content: Union[str, Iterable[str]]) -> None:
+    # Accepts the whole XML or an iterable of pieces, which save() streams out
+    self._content = content
+
+  def _encoded_content(self) -> Iterator[bytes]:
+    pieces = [self._content] if isinstance(self._content, str) else self._content
+    for piece in pieces:
+      for start in range(0, len(piece), WRITE_CHUNK_CHARS):
+        yield piece[start:start + WRITE_CHUNK_CHARS].encode('utf-8')
+
+  def save(self, output: Union[str, IO[bytes]]) -> None:
+    # Only a modified document.xml is re-encoded; every other member (images, media,
+    # styles...) is copied compressed, byte for byte. output may be a path, which is replaced
+    # atomically, or a binary file object such as io.BytesIO.
+    if isinstance(output, str):
+      _replace_atomically(output, self._write_zip)
+    else:
+      self._write_zip(output)
+
+  def _write_zip(self, output: IO[bytes]) -> None:
+    writer = _ZipWriter(output)
+    with open(self.filepath, 'rb') as source_fp:
+      for info in self.zipfile.infolist():
+        if info.filename == DOCUMENT_XML and self._content is not None:
+          writer.write_deflated(info, self._encoded_content())
+          if not isinstance(self._content, str):
+            self._content = None  # A consumed iterator can't be written twice
         else:
-          f.writestr(file, self.zipfile.read(file.filename))
+          writer.copy_raw(source_fp, info)
+    writer.close(self.zipfile.comment)
 
 
-def get_filled_xml(input_xml: str, qa_pairs=List[Tuple[str, str]], model_name: str=DEFAULT_MODEL) -> List[str]:
-  prompt_template = """
-Modify the input XML of a docx to add answers asked in the document. 
-Return on only the modified XML content. 
-Don't add any explanation or other information in the output.
+_STRUCTURE_TAG_RE = re.compile(r'<(/?)(w:p|w:tc|w:tr)(?=[\s>/])[^>]*?(/?)>')
+_TEXT_RE = re.compile(r'<w:t(?:\s[^>]*)?>([^<]*)</w:t>')
+_BODY_END_RE = re.compile(r'<w:sectPr[\s>/]|</w:body>')
+
+# Questions whose best paragraph is less similar than this go to the LLM
+MATCH_THRESHOLD = 0.85
+# Unmatched questions are sent to the LLM this many at a time, each with a few candidate snippets
+LLM_BATCH_SIZE = 10
+LLM_CANDIDATES = 5
+
+
+# Same rule as answer_cache.normalize_question: numbering needs a delimiter or a capitalized
+# word after it, so "10 users" and "100 users" stay different questions
+_LEADING_NUMBERING_RE = re.compile(
+  r'^\s*(?:(?i:q(?:uestion)?)\s*\d+(?:\.\d+)*(?:\s*[.):-]\s+|\s+(?=[A-Z]))'
+  r'|\(?\d+(?:\.\d+)*\s*[.):-]\s+'
+  r'|\d+(?:\.\d+)+\s+(?=[A-Z]))'
+)
+
 
-**The Question Answer pairs**
+def _normalize(text: str) -> str:
+  text = _LEADING_NUMBERING_RE.sub('', text).lower()
+  return re.sub(r'\s+', ' ', text).strip().rstrip('?.!:;').strip()
 
-{qa_pairs_str}
 
-**The XML content**
+def _scan_structure(xml: str) -> Tuple[List[dict], List[dict]]:
+  # Locate every paragraph and table cell by character offsets so answers can be
+  # spliced into the original XML without re-serializing it
+  paragraphs, cells = [], []
+  open_paragraphs, open_cells, open_rows = [], [], []
+  for match in _STRUCTURE_TAG_RE.finditer(xml):
+    closing, tag, self_closing = match.group(1), match.group(2), match.group(3)
+    if tag == 'w:p':
+      if self_closing:
+        paragraphs.append({'start': match.start(), 'end': match.end(), 'empty_tag': True,
+                           'cell': open_cells[-1] if open_cells else None})
+        if open_cells:
+          cells[open_cells[-1]]['paragraphs'].append(len(paragraphs) - 1)
+      elif not closing:
+        open_paragraphs.append(len(paragraphs))
+        paragraphs.append({'start': match.start(), 'empty_tag': False, 'cell': open_cells[-1] if open_cells else None})
+        if open_cells:
+          cells[open_cells[-1]]['paragraphs'].append(len(paragraphs) - 1)
+      elif open_paragraphs:
+        paragraphs[open_paragraphs.pop()]['end'] = match.end()
+    elif tag == 'w:tc':
+      if not closing and not self_closing:
+        open_cells.append(len(cells))
+        cells.append({'paragraphs': [], 'row': open_rows[-1] if open_rows else None})
+      elif closing and open_cells:
+        open_cells.pop()
+    elif tag == 'w:tr':
+      if not closing and not self_closing:
+        open_rows.append(match.start())
+      elif closing and open_rows:
+        open_rows.pop()
+  for paragraph in paragraphs:
+    body = xml[paragraph['start']:paragraph['end']]
+    paragraph['text'] = html.unescape(''.join(_TEXT_RE.findall(body))).strip()
+  for cell in cells:
+    cell['text'] = ' '.join(paragraphs[i]['text'] for i in cell['paragraphs'] if paragraphs[i]['text'])
+  return paragraphs, cells
 
-{input_xml}
+
+def _similarity(a: str, b: str) -> float:
+  if not a or not b:
+    return 0.0
+  if a == b:
+    return 1.0
+  if a in b or b in a:
+    # Containment, e.g. a question with a trailing instruction or a cell label
+    return 0.9 if min(len(a), len(b)) >= 0.6 * max(len(a), len(b)) else 0.8
+  return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def _answer_runs(answer: str) -> str:
+  lines = [html.escape(line, quote=False) for line in str(answer).splitlines()] or ['']
+  return '<w:r>' + '<w:br/>'.join(f'<w:t xml:space="preserve">{line}</w:t>' for line in lines) + '</w:r>'
+
+
+def _fill_paragraph(xml: str, paragraph: dict, answer: str) -> Tuple[int, int, str]:
+  # Edit (start, end, replacement) putting the answer runs into an existing paragraph
+  if paragraph['empty_tag']:
+    return paragraph['start'], paragraph['end'], f'<w:p>{_answer_runs(answer)}</w:p>'
+  end = paragraph['end'] - len('</w:p>')
+  return end, end, _answer_runs(answer)
+
+
+def _answer_edit(xml: str, paragraphs: List[dict], cells: List[dict], index: int, answer: str, used: set) -> Tuple[int, int, str]:
+  paragraph = paragraphs[index]
+  cell = paragraph['cell']
+  if cell is not None:
+    # Form tables: the answer goes in the next empty cell of the same row
+    for other in range(cell + 1, len(cells)):
+      if cells[other]['row'] != cells[cell]['row']:
+        break
+      if not cells[other]['text'] and cells[other]['paragraphs'] and cells[other]['paragraphs'][0] not in used:
+        target = cells[other]['paragraphs'][0]
+        used.add(target)
+        return _fill_paragraph(xml, paragraphs[target], answer)
+  # An empty placeholder paragraph right after the question in the same container is reused
+  following = index + 1
+  if (following < len(paragraphs) and following not in used and not paragraphs[following]['text']
+      and paragraphs[following]['cell'] == cell and paragraphs[following]['start'] >= paragraph['end']):
+    used.add(following)
+    return _fill_paragraph(xml, paragraphs[following], answer)
+  return paragraph['end'], paragraph['end'], f'<w:p>{_answer_runs(answer)}</w:p>'
+
+
+def _best_matches(question: str, paragraphs: List[dict], used: set) -> List[Tuple[float, int]]:
+  normalized = _normalize(question)
+  scores = []
+  for i, paragraph in enumerate(paragraphs):
+    if i in used or not paragraph['text']:
+      continue
+    scores.append((_similarity(normalized, _normalize(paragraph['text'])), i))
+  scores.sort(reverse=True)
+  return scores
+
+
+def _locate_with_llm(qa_items: List[Tuple[int, str]], paragraphs: List[dict], used: set, model_name: str,
+                     cache: Optional[ResponseCache]=None) -> dict:
+  # Ask the LLM to pick, for each unmatched question, which candidate paragraph asks it.
+  # Only short snippets are sent, never the document XML. With a cache, a prompt that
+  # was answered before is served from disk.
+  prompt_template = """
+For each question below, pick the id of the document paragraph that asks it, from that question's candidates.
+Return only a JSON object mapping each question number to a paragraph id, or to null if none of its candidates asks it.
+Don't add any explanation or other information in the output.
+
+{questions_str}
   """
-  qa_pairs_str = '\n\n'.join([f'Q:{q}\nA:{a}' for q, a in qa_pairs])
-  prompt = PromptTemplate(
-      input_variables=["document"], template=prompt_template
-  )
-  print(f'Prompt: {prompt}')
+  locations = {}
   llm_model = get_llm_model(model_name=model_name)
+  prompt = PromptTemplate(input_variables=['questions_str'], template=prompt_template)
   chain = prompt | llm_model | StrOutputParser()
-  print(f'Chain: {chain}')
-  model_resp = chain.invoke(dict(qa_pairs_str=qa_pairs_str, input_xml=input_xml))
-  model_resp = model_resp.strip()
-  # Trim ```xml and ``` from the response
-  if model_resp.startswith('```xml'):
-    model_resp = model_resp[6:]
-  if model_resp.endswith('```'):
-    model_resp = model_resp[:-3]
-  return model_resp.strip()
-
-
-def fill_docx_with_qa(docx_path: str, qa_pairs: List[Tuple[str, str]], model_name: str=DEFAULT_MODEL) -> str:
-  docx = Docx(docx_path)
-  filled_xml = get_filled_xml(docx.content_xml, qa_pairs, model_name)
-  docx.set_content_xml(filled_xml)
-  out_path = docx_path.replace('.docx', '_filled.docx') 
-  docx.save(out_path)
+  for batch_start in range(0, len(qa_items), LLM_BATCH_SIZE):
+    batch = qa_items[batch_start:batch_start + LLM_BATCH_SIZE]
+    allowed, blocks = {}, []
+    for n, (qa_index, question) in enumerate(batch, start=1):
+      candidates = [i for _, i in _best_matches(question, paragraphs, used)[:LLM_CANDIDATES]]
+      allowed[n] = (qa_index, set(candidates))
+      snippets = '\n'.join(f'  [{i}] {paragraphs[i]["text"][:300]}' for i in candidates)
+      blocks.append(f'Question {n}: {question}\nCandidates:\n{snippets}')
+    questions_str = '\n\n'.join(blocks)
+    key = cache_key('llm', model_name, prompt.format(questions_str=questions_str)) if cache is not None else None
+    cached = cache.get_text(key) if cache is not None else None
+    model_resp = (cached if cached is not None else chain.invoke(dict(questions_str=questions_str))).strip()
+    if model_resp.startswith('```'):
+      model_resp = model_resp.strip('`').strip()
+      if model_resp.startswith('json'):
+        model_resp = model_resp[4:]
+    try:
+      mapping = json.loads(model_resp)
+    except ValueError:
+      mapping = None
+    if not isinstance(mapping, dict):
+      print(f'Could not parse the paragraph mapping: {model_resp}')
+      continue
+    if cache is not None and cached is None:
+      cache.put(key, model_resp)  # Only completions that parsed are worth serving again
+    for key, paragraph_id in mapping.items():
+      n = int(key) if str(key).isdigit() else None
+      if n in allowed and isinstance(paragraph_id, int) and paragraph_id in allowed[n][1] and paragraph_id not in used:
+        locations[allowed[n][0]] = paragraph_id
+        used.add(paragraph_id)
+  return locations
+
+
+def _plan_edits(input_xml: str, qa_pairs: List[Tuple[str, str]], model_name: str=DEFAULT_MODEL,
+                cache: Optional[ResponseCache]=None) -> Tuple[List[Tuple[int, int, str]], int]:
+  # Find each question's paragraph or table cell locally, asking the LLM only about
+  # questions that can't be matched textually. Returns the edits in document order and
+  # how many QA pairs couldn't be located (those are appended at the end of the body).
+  paragraphs, cells = _scan_structure(input_xml)
+  used = set()
+  locations, unmatched = {}, []
+  for qa_index, (question, _) in enumerate(qa_pairs):
+    matches = _best_matches(question, paragraphs, used)
+    if matches and matches[0][0] >= MATCH_THRESHOLD:
+      locations[qa_index] = matches[0][1]
+      used.add(matches[0][1])
+    else:
+      unmatched.append((qa_index, question))
+  if unmatched and paragraphs:
+    print(f'Locating {len(unmatched)} unmatched questions with the LLM')
+    locations.update(_locate_with_llm(unmatched, paragraphs, used, model_name, cache))
+
+  edits = [_answer_edit(input_xml, paragraphs, cells, index, qa_pairs[qa_index][1], used)
+           for qa_index, index in locations.items()]
+
+  # Anything still unplaced is appended at the end of the body so no answer is lost
+  leftovers = [qa_pairs[qa_index] for qa_index in range(len(qa_pairs)) if qa_index not in locations]
+  if leftovers:
+    body_end = _BODY_END_RE.search(input_xml)
+    position = body_end.start() if body_end else len(input_xml)
+    appendix = ''.join(f'<w:p>{_answer_runs(question)}</w:p><w:p>{_answer_runs(answer)}</w:p>' for question, answer in leftovers)
+    edits.append((position, position, appendix))
+  return sorted(edits, key=lambda edit: (edit[0], edit[1])), len(leftovers)
+
+
+def _apply_edits(input_xml: str, edits: List[Tuple[int, int, str]]) -> Iterator[str]:
+  # Stream the original XML with the edits applied in document order
+  cursor = 0
+  for start, end, replacement in edits:
+    yield input_xml[cursor:start]
+    yield replacement
+    cursor = end
+  yield input_xml[cursor:]
+
+
+def iter_filled_xml(input_xml: str, qa_pairs: List[Tuple[str, str]], model_name: str=DEFAULT_MODEL,
+                    cache: Optional[ResponseCache]=None) -> Iterator[str]:
+  # Splice each answer in after its question, yielding the filled XML in pieces
+  edits, _ = _plan_edits(input_xml, qa_pairs, model_name, cache)
+  yield from _apply_edits(input_xml, edits)
+
+
+def get_filled_xml(input_xml: str, qa_pairs: List[Tuple[str, str]], model_name: str=DEFAULT_MODEL,
+                   cache: Optional[ResponseCache]=None) -> str:
+  return ''.join(iter_filled_xml(input_xml, qa_pairs, model_name, cache))
+
+
+def _file_sha256(path: str) -> str:
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(COPY_CHUNK_BYTES), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def fill_docx_with_qa(docx_path: str, qa_pairs: List[Tuple[str, str]], model_name: str=DEFAULT_MODEL,
+                      output: Optional[IO[bytes]]=None, cache: Optional[ResponseCache]=None,
+                      document_digest: Optional[str]=None) -> Union[str, IO[bytes]]:
+  # Writes <name>_filled.docx next to the input and returns its path, or writes into
+  # the given binary file object (e.g. io.BytesIO) and returns that.
+  # With a cache, the same document (by digest) filled with the same QA pairs is
+  # served from disk; document_digest saves hashing the file when the caller knows it.
+  out_path = docx_path.replace('.docx', '_filled.docx')
+  key, filled = None, None
+  if cache is not None:
+    key = cache_key('filled-docx', document_digest or _file_sha256(docx_path), model_name,
+                    json.dumps([list(pair) for pair in qa_pairs]))
+    filled = cache.get(key)
+  if filled is None:
+    with Docx(docx_path) as docx:
+      # Every edit, LLM lookups included, is resolved before the output is opened
+      edits, unplaced = _plan_edits(docx.content_xml, qa_pairs, model_name, cache)
+      docx.set_content_xml(_apply_edits(docx.content_xml, edits))
+      if cache is None:
+        docx.save(output if output is not None else out_path)
+        return output if output is not None else out_path
+      buffer = io.BytesIO()
+      docx.save(buffer)
+    filled = buffer.getvalue()
+    if not unplaced:
+      # A document with answers appended at the end may place better next time
+      cache.put(key, filled)
+  if output is not None:
+    output.write(filled)
+    return output
+  _replace_atomically(out_path, lambda f: f.write(filled))
   return out_path
 
 
@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import uuid
+from answer_engine import answer_questions, DEFAULT_CONCURRENCY
+
+DEFAULT_JOB_WORKERS = 4  # Questionnaires parsed/answered at the same time
+MAX_FINISHED_JOBS = 200  # Oldest finished jobs are forgotten beyond this
+
+class Job:
+  def __init__(self, doc_path, chatbot_link):
+    self.id = uuid.uuid4().hex
+    self.doc_path = doc_path
+    self.chatbot_link = chatbot_link
+    self.status = 'queued'
+    self.error = None
+    self.questions = []
+    self.results = []
+    self.events = []
+    self.created_at = time.time()
+    self.finished_at = None
+    self._cond = threading.Condition()
+
+  def emit(self, event_type, data=None, status=None):
+    with self._cond:
+      if status is not None:
+        self.status = status
+      self.events.append({'id': len(self.events), 'type': event_type, 'data': data or {}})
+      self._cond.notify_all()
+
+  def wait_events(self, after=0, timeout=None):
+    # Events with an id >= after, blocking up to timeout seconds until there is one
+    with self._cond:
+      self._cond.wait_for(lambda: len(self.events) > after or self.finished, timeout)
+      return self.events[after:]
+
+  @property
+  def finished(self):
+    return self.status in ('done', 'failed')
+
+  def snapshot(self):
+    with self._cond:
+      answered = sum(1 for result in self.results if result is not None)
+      return {
+        'job_id': self.id,
+        'status': self.status,
+        'error': self.error,
+        'questions': list(self.questions),
+        'results': list(self.results),
+        'answered': answered,
+        'total': len(self.questions),
+      }
+
+
+class JobManager:
+  # Runs parse + answer for submitted questionnaires on a small worker pool;
+  # per-question progress is published as events on the job
+  def __init__(self, parse_fn, submit_fn, workers=DEFAULT_JOB_WORKERS, concurrency=DEFAULT_CONCURRENCY):
+    self.parse_fn = parse_fn
+    self.submit_fn = submit_fn
+    self.concurrency = concurrency
+    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+    self._jobs = {}
+    self._lock = threading.Lock()
+
+  def submit(self, doc_path, chatbot_link):
+    job = Job(doc_path, chatbot_link)
+    with self._lock:
+      self._jobs[job.id] = job
+      self._forget_old_jobs()
+    job.emit('queued', {'job_id': job.id})
+    self._executor.submit(self._run, job)
+    return job
+
+  def get(self, job_id):
+    with self._lock:
+      return self._jobs.get(job_id)
+
+  def _forget_old_jobs(self):
+    finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at)
+    for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+      del self._jobs[job.id]
+
+  def _run(self, job):
+    try:
+      job.emit('parsing', status='parsing')
+      questions = self.parse_fn(job.doc_path)
+      with job._cond:
+        job.questions = questions
+        job.results = [None] * len(questions)
+      job.emit('questions', {'questions': questions}, status='answering')
+
+      def on_result(index, result):
+        with job._cond:
+          job.results[index] = result
+        job.emit('answer', dict(result, index=index))
+
+      answer_questions(questions, job.chatbot_link, concurrency=self.concurrency, submit_fn=self.submit_fn, on_result=on_result)
+      job.finished_at = time.time()
+      job.emit('done', {'answered': sum(1 for r in job.results if r['error'] is None), 'total': len(questions)}, status='done')
+    except Exception as e:
+      print(f'Job {job.id} failed: {str(e)}')
+      job.error = str(e)
+      job.finished_at = time.time()
+      job.emit('failed', {'error': str(e)}, status='failed')
@@ -1,8 +1,14 @@
+import threading
+
 from langchain_openai.chat_models.base import BaseChatOpenAI, ChatOpenAI
 
 DEFAULT_MODEL = 'gpt-4o-mini-2024-07-18'
 ADVANCED_MODEL = 'gpt-4o-2024-05-13'
 
+# One client (and HTTP connection pool) per model and settings, shared by every request in the process
+_models = {}
+_models_lock = threading.Lock()
+
 
 def get_llm_model(
     model_name: str,
@@ -11,10 +17,14 @@ def get_llm_model(
     timeout: int = 115,
     max_retries: int = 27,
 ) -> BaseChatOpenAI:
-  return ChatOpenAI(
-      model_name=model_name,
-      request_timeout=timeout,
-      max_tokens=max_tokens,
-      temperature=temperature,
-      max_retries=max_retries
-  )
\ No newline at end of file
+  key = (model_name, temperature, max_tokens, timeout, max_retries)
+  with _models_lock:
+    if key not in _models:
+      _models[key] = ChatOpenAI(
+          model_name=model_name,
+          request_timeout=timeout,
+          max_tokens=max_tokens,
+          temperature=temperature,
+          max_retries=max_retries
+      )
+    return _models[key]
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+# Shares the CLI's cache directory (AUTO_ORACLE_CACHE_DIR or <repo>/.cache)
+DEFAULT_CACHE_DIR = os.getenv('AUTO_ORACLE_CACHE_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache'))
+DEFAULT_MAX_BYTES = int(os.getenv('AUTO_ORACLE_RESPONSE_CACHE_BYTES', 256 * 1024 * 1024))
+
+def cache_key(*parts: str) -> str:
+  # SHA-256 over the parts, separated so ('ab', 'c') and ('a', 'bc') differ
+  digest = hashlib.sha256()
+  for part in parts:
+    digest.update(part.encode('utf-8'))
+    digest.update(b'\0')
+  return digest.hexdigest()
+
+class ResponseCache:
+  # Persistent key -> bytes store for expensive generation results: LLM completions keyed
+  # by a hash of model and prompt, and filled documents keyed by document digest and QA
+  # pairs. Least recently used entries are evicted once the total size passes max_bytes.
+  def __init__(self, path: Optional[str]=None, max_bytes: int=DEFAULT_MAX_BYTES) -> None:
+    self.path = path or os.path.join(DEFAULT_CACHE_DIR, 'responses.sqlite3')
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+    with self._lock, self._conn:
+      self._conn.execute('PRAGMA journal_mode=WAL')
+      self._conn.execute(
+        'CREATE TABLE IF NOT EXISTS responses ('
+        ' key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used_at REAL NOT NULL)'
+      )
+      self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used_at)')
+
+  def get(self, key: str) -> Optional[bytes]:
+    with self._lock, self._conn:
+      row = self._conn.execute('SELECT value FROM responses WHERE key = ?', (key,)).fetchone()
+      if row is None:
+        self.misses += 1
+        return None
+      self._conn.execute('UPDATE responses SET last_used_at = ? WHERE key = ?', (time.time(), key))
+      self.hits += 1
+      return bytes(row[0])
+
+  def get_text(self, key: str) -> Optional[str]:
+    value = self.get(key)
+    return None if value is None else value.decode('utf-8')
+
+  def put(self, key: str, value: bytes) -> None:
+    if isinstance(value, str):
+      value = value.encode('utf-8')
+    if len(value) > self.max_bytes:
+      return
+    with self._lock, self._conn:
+      self._conn.execute(
+        'INSERT OR REPLACE INTO responses (key, value, size, last_used_at) VALUES (?, ?, ?, ?)',
+        (key, value, len(value), time.time())
+      )
+      total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+      if total > self.max_bytes:
+        # Drop the least recently used entries until back under the limit
+        for old_key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY last_used_at').fetchall():
+          if total <= self.max_bytes:
+            break
+          if old_key == key:
+            continue
+          self._conn.execute('DELETE FROM responses WHERE key = ?', (old_key,))
+          total -= size
+
+  def stats(self) -> dict:
+    with self._lock:
+      count, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+    return {'hits': self.hits, 'misses': self.misses, 'entries': count, 'bytes': total}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+  global _cache
+  with _cache_lock:
+    if _cache is None:
+      _cache = ResponseCache()
+    return _cache
@@ -1,138 +1,134 @@
-from aihub import AIHub
+import io
 import os
-import uuid
+import sys
 import time
-from flask import Flask, request, jsonify, send_file
-from urllib.parse import urlparse
+from functools import partial
+import json
+from flask import Flask, request, jsonify, send_file, Response, g
 from genarate_docs import fill_docx_with_qa
 from flask_cors import CORS  # Add this import
 
+# The answering engine lives in the repository root next to the CLI
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from answer_engine import answer_questions, DEFAULT_CONCURRENCY
+from knowledge_base_query import submit_query
+from answer_cache import get_answer_cache
+from aihub_client import CircuitOpenError
+import questionnaire_parser
+from jobs import JobManager
+from batch_runner import QUESTIONNAIRE_EXTENSIONS
+from upload_store import get_upload_store, UploadTooLargeError, DEFAULT_MAX_UPLOAD_BYTES
+from response_cache import get_response_cache
+from metrics import registry, span
+
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = DEFAULT_MAX_UPLOAD_BYTES + 1024 * 1024  # Room for the multipart framing
 CORS(app)
 
-client = AIHub(api_root="https://aihub.instabase.com/api", api_key="ncyMgvQkVE0bAJxa7mFs07zUxLMKdW", ib_context="ib-internal")
+http_requests = registry.counter('http_requests_total', 'Requests served, by route, method and status')
+http_seconds = registry.histogram('http_request_seconds', 'Time to produce a response, by route')
+fill_seconds = registry.histogram('fill_docx_seconds', 'Time to fill a .docx with answers')
 
-def parse_questionnaire(doc_path):
-    # Create a conversation and upload the document
-    conversation = client.conversations.create(
-        name='Questionnaire Conversation',
-        description='Conversation for parsing questionnaire',
-        files=[doc_path]
-    )
-    # Get the conversation ID
-    conversation_id = conversation.id
-    
-    # Check the status of the conversation
-    status = client.conversations.status(conversation_id)
-    
-    # Wait for the conversation to finish processing
-    while status.state == 'RUNNING':
-        print("Status: Processing questionairre document...")
-        time.sleep(5)
-        status = client.conversations.status(conversation_id)
-    
-    # Check if processing was successful
-    if status.state == 'COMPLETE':
-        print("Status: Processing complete. Conversation ID = ", conversation_id)
-        # Pull in the document ID
-        document_id = status.documents[0].id
-        
-        # Prepare the prompt for querying
-        prompt = 'Given the document look for all the questionaire asked in the document. The question can be in any form like a statement, field name or a question itself. Return the  output exactly in a list format ["question 1 text", "question 2 text", etc.]. If no questions are identified, please return exactly an empty list. Preserve the question numbers if given in the document. Do not include any other information in the output.Make sure the output format is a LIST'
-        
-        # Query the document
-        answer = client.conversations.converse(
-            conversation_id=conversation_id,
-            question=prompt,
-            document_ids=[document_id]
-        )
-        
-        #print("Found the following questions", questions)
-        #questions = questions.answer.split("\n")
-        answer = answer.answer
-        print (type(answer))
-        answer = answer.strip('```').strip('python')
-        answer = answer.strip().strip('json').strip()
-        print (answer)
-        questions = eval(answer)
-        #print(f'questions: {questions}')
-        # Parse the answer into a list of questions
-        try:
-            # questions = eval(answer.answer.split("\n-"))
-            if not isinstance(questions, list):
-                print("Error: The answer is not a valid list.")
-                raise ValueError("Error: The answer is not a valid list.")
-        except Exception as e:
-           print(f"Error: Failed to parse the answer. {str(e)}")
-           raise ValueError(f"Error: Failed to parse the answer. {str(e)}")
-
-        # Return the list of questions
-        return questions
-    else:
-        print("Error: The conversation could not be processed.")
-        raise ValueError("Error: The conversation could not be processed.")
-
-
-
-def query_knowledge_base(question, chatbot_link):  # Added chatbot_link parameter
-    # Extract the chatbot ID from the chatbot_link
-    parsed_url = urlparse(chatbot_link)
-    chatbot_id = parsed_url.path.split('/')[-1]  # Get the last part of the path as the ID
-
-    # Define the source_app with the chatbot ID
-    source = {
-        'type': 'CHATBOT',
-        'id': chatbot_id  # Use the extracted chatbot ID
-    }
-    # Send a query to the chatbot
-    response = client.queries.run(
-        query=question,
-        source_app = source,
-        model_name = 'multistep-lite',  # Optional: specify the model
-        include_source_info=False  # Optional: specify if you want source info
-    )
-    
-    # Get the query ID to check the status
-    query_id = response.query_id
-
-    # Check query status until an answer is ready
-    status_response = client.queries.status(query_id)
-    while status_response.status == 'RUNNING':
-        time.sleep(5)  # Wait before checking again
-        status_response = client.queries.status(query_id)
-
-    # Parse the chatbot answer
-    if status_response.status == 'COMPLETE':
-        for result in status_response.results:
-            return result.response  # Return the chatbot's answer
-    else:
-        print(f"Error: {status_response.error}")
-        raise ValueError(f"Error: {status_response.error}")  # Handle errors
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    # Streaming responses (SSE) are timed until their first byte, not until the stream ends
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    if 'started' in g:
+        http_seconds.observe(time.perf_counter() - g.started, route=route, method=request.method)
+    http_requests.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text exposition of every counter and timer in the process
+    return Response(registry.prometheus(), mimetype='text/plain; version=0.0.4')
 
+def submit_chatbot_query(question, chatbot_link, use_cache=True, refresh=False):
+    # Answers are shared with the CLI through the on-disk answer cache
+    cache = get_answer_cache() if use_cache else None
+    return submit_query(question, chatbot_link, cache=cache, refresh=refresh)
+
+PARSE_PROMPT = 'Given the document look for all the questionaire asked in the document. The question can be in any form like a statement, field name or a question itself. Return the  output exactly in a list format ["question 1 text", "question 2 text", etc.]. If no questions are identified, please return exactly an empty list. Preserve the question numbers if given in the document. Do not include any other information in the output.Make sure the output format is a LIST'
+
+def parse_questionnaire(doc_path):
+    # Shares the CLI parser, so re-parsing an unchanged upload skips AIHub entirely;
+    # stored uploads are named by their digest, which saves hashing them again
+    sha256 = get_upload_store().digest_of(doc_path)
+    return questionnaire_parser.parse_questionnaire(doc_path, prompt=PARSE_PROMPT, sha256=sha256)
 
 
 @app.route('/query', methods=['POST'])
 def query_chatbot():
     try:
         data = request.get_json()
-        if not data or 'question' not in data or 'chatbot_link' not in data:
+        if not data or ('question' not in data and 'questions' not in data) or 'chatbot_link' not in data:
             print('Both question and chatbot_link are required')
             return jsonify({'error': 'Both question and chatbot_link are required'}), 400
         
-        question = data['question']
         chatbot_link = data['chatbot_link']
-        
-        answer = query_knowledge_base(question, chatbot_link)
+        submit_fn = partial(submit_chatbot_query, use_cache=not data.get('no_cache', False), refresh=data.get('refresh', False))
+
+        # Several questions can be answered concurrently in a single request
+        if 'questions' in data:
+            concurrency = int(data.get('concurrency', DEFAULT_CONCURRENCY))
+            results = answer_questions(data['questions'], chatbot_link, concurrency=concurrency, submit_fn=submit_fn)
+            return jsonify({'results': results})
+
+        # A single question waits on its Future directly so the exception keeps its type
+        # (CircuitOpenError -> 503, a failed query -> 400)
+        answer = submit_fn(data['question'], chatbot_link).result()
         return jsonify({'answer': answer})
     
     except ValueError as e:
         print(f'Error: {str(e)}')
         return jsonify({'error': str(e)}), 400
+    except CircuitOpenError as e:
+        print(f'Error: {str(e)}')
+        return jsonify({'error': str(e)}), 503
+    except TimeoutError as e:
+        print(f'Error: {str(e)}')
+        return jsonify({'error': str(e)}), 504
     except Exception as e:
         print(f'Unexpected error: {str(e)}')
         return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
 
 
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(dict(get_answer_cache().stats(), responses=get_response_cache().stats()))
+
+
+def save_upload(file):
+    # Streamed into the content-addressed store; identical files are kept once
+    return get_upload_store().save(file.stream, file.filename)
+
+
+def resolve_document(document_id=None, doc_path=None, document_name=None):
+    # Uploads are referenced by document ID. Paths and bare file names from older
+    # clients are still accepted, but only for documents inside the upload directory,
+    # so a request can't send any file the server can read to AIHub
+    store = get_upload_store()
+    if document_id:
+        return store.path(document_id)
+    path = doc_path or (os.path.join(store.root, document_name) if document_name else None)
+    if not path:
+        return None
+    root = os.path.realpath(store.root)
+    path = os.path.realpath(path)
+    if os.path.commonpath([root, path]) != root or not path.lower().endswith(QUESTIONNAIRE_EXTENSIONS):
+        return None
+    return path
+
+
+@app.errorhandler(UploadTooLargeError)
+def upload_too_large(e):
+    return jsonify({'error': str(e)}), 413
+
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -142,15 +138,19 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
-    # Create uploads directory if it doesn't exist
-    upload_dir = 'uploads'
-    os.makedirs(upload_dir, exist_ok=True)
+    upload = save_upload(file)
+    return jsonify({
+        'documentId': upload['document_id'],
+        'filePath': upload['path'],
+        'fileName': upload['filename'],
+        'size': upload['size'],
+        'deduplicated': upload['deduplicated']
+    })
 
-    # Save the file
-    filepath = os.path.join(upload_dir, file.filename)
-    file.save(filepath)
 
-    return jsonify({'filePath': filepath})
+@app.route('/uploads', methods=['GET'])
+def upload_stats():
+    return jsonify(get_upload_store().stats())
 
 
 @app.route('/parse', methods=['POST'])
@@ -158,11 +158,13 @@ def parse_document():
     try:
         data = request.get_json()
         print (data)
-        if not data or 'doc_path' not in data:
-            print('doc_path is required')
-            return jsonify({'error': 'doc_path is required'}), 400
+        if not data or not (data.get('document_id') or data.get('doc_path')):
+            print('document_id or doc_path is required')
+            return jsonify({'error': 'document_id or doc_path is required'}), 400
         
-        doc_path = data['doc_path']
+        doc_path = resolve_document(data.get('document_id'), data.get('doc_path'))
+        if doc_path is None:
+            return jsonify({'error': 'Unknown document'}), 404
         print(f'Parsing document at {doc_path}')
         questions = parse_questionnaire(doc_path)
         return jsonify({'questions': questions})
@@ -183,8 +185,10 @@ def generate_documents():
         #     print('question, answer and output_filepath is required')
         #     return jsonify({'error': 'question, answer and output_filepath is required'}), 400
         
-        doc_name = data['documentName']
-        doc_path = f'uploads/{doc_name}'
+        doc_name = data.get('documentId') or data['documentName']
+        doc_path = resolve_document(data.get('documentId'), document_name=data.get('documentName'))
+        if doc_path is None:
+            return jsonify({'error': 'Unknown document'}), 404
         qaArray = data['qaArray']
         qa_pairs = []
         for each in qaArray:
@@ -196,11 +200,15 @@ def generate_documents():
         # qa_pairs = list(zip(questions, answers))
         # output_filepath = data['output_filepath']
 
-        #out_path = fill_docx_with_qa(doc_path, qa_pairs)
-        time.sleep(5)
-        out_path = '/Users/subbu/Projects/hackathon/auto-oracle/api-call-server/uploads/Sample RFP_filled.docx'
+        # Answers are placed locally; the LLM is only consulted for questions it can't find.
+        # The filled document is built in memory, no temp file needed, and a repeated
+        # request for the same document and answers is served from the response cache
+        with fill_seconds.time(), span('fill_docx', document=doc_name, questions=len(qa_pairs)):
+            out_file = fill_docx_with_qa(doc_path, qa_pairs, output=io.BytesIO(), cache=get_response_cache(),
+                                         document_digest=get_upload_store().digest_of(doc_path))
+        out_file.seek(0)
         return send_file(
-            out_path,  # Path to your generated file
+            out_file,  # The generated file
             mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
             as_attachment=True,  # This prompts download instead of displaying in browser
             download_name='generated-document.docx'  # Name of the downloaded file
@@ -214,9 +222,85 @@ def generate_documents():
 
 
 
+# Background workers parse and answer whole questionnaires; clients follow progress
+# through /jobs/<job_id>/events (Server-Sent Events) or /jobs/<job_id>/poll
+job_manager = JobManager(parse_questionnaire, submit_chatbot_query)
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    # Accepts either a multipart upload (file + chatbot_link) or JSON with the document_id of an upload
+    if 'file' in request.files:
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No selected file'}), 400
+        doc_path = save_upload(file)['path']
+        chatbot_link = request.form.get('chatbot_link')
+    else:
+        data = request.get_json(silent=True) or {}
+        if not data.get('document_id'):
+            return jsonify({'error': 'A file or document_id is required'}), 400
+        doc_path = resolve_document(data['document_id'])
+        if doc_path is None:
+            return jsonify({'error': 'Unknown document_id'}), 404
+        chatbot_link = data.get('chatbot_link')
+    if not chatbot_link:
+        return jsonify({'error': 'chatbot_link is required'}), 400
+
+    job = job_manager.submit(doc_path, chatbot_link)
+    return jsonify({'job_id': job.id, 'status': job.status}), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.snapshot())
+
+
+@app.route('/jobs/<job_id>/poll', methods=['GET'])
+def poll_job(job_id):
+    # Long-poll: returns as soon as there are events after `after`, or after `timeout` seconds
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    after = request.args.get('after', 0, type=int)
+    timeout = min(request.args.get('timeout', 25, type=float), 60)
+    events = job.wait_events(after, timeout)
+    return jsonify({'status': job.status, 'events': events, 'next': after + len(events)})
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    # EventSource sends Last-Event-ID when it reconnects; a malformed one falls back to `after`
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    after = max(last_event_id + 1, 0) if last_event_id is not None else request.args.get('after', 0, type=int)
+
+    def generate():
+        position = after
+        while True:
+            events = job.wait_events(position, timeout=15)
+            if not events:
+                if job.finished:
+                    return
+                yield ': keep-alive\n\n'
+                continue
+            for event in events:
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+            position += len(events)
+            if job.finished and position >= len(job.events):
+                return
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+
 if __name__ == '__main__':
     #app.run(debug=True, port=5000)
-   app.run(host="127.0.0.1", port=5001)
+   app.run(host="127.0.0.1", port=5001, threaded=True)
    #print (query_knowledge_base('What are the steps to run an AI Hub app from my python code?', 'https://aihub.instabase.com/hub/apps/0686b7fe-c04c-42ea-ab3f-4c940abc1baa'))
    #parse_questionnaire('uploads/Instabase_Ai_Hub_Sample_Queries_v2.pdf')
 #    qa_pairs = [
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import IO, Optional
+
+# Uploads are stored once per content digest under DEFAULT_UPLOAD_DIR/objects
+DEFAULT_UPLOAD_DIR = os.getenv('AUTO_ORACLE_UPLOAD_DIR', 'uploads')
+DEFAULT_MAX_UPLOAD_BYTES = int(os.getenv('AUTO_ORACLE_MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
+DEFAULT_QUOTA_BYTES = int(os.getenv('AUTO_ORACLE_UPLOAD_QUOTA_BYTES', 2 * 1024 * 1024 * 1024))
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60  # Uploads not used for 30 days are evicted
+CHUNK_SIZE = 1024 * 1024
+
+DOCUMENT_ID = re.compile(r'^[0-9a-f]{64}$')
+
+class UploadTooLargeError(ValueError):
+  pass
+
+def _extension(filename: str) -> str:
+  # Only the extension of the client's file name is kept; the parser relies on it (.docx)
+  ext = os.path.splitext(filename or '')[1].lower()
+  return ext if re.fullmatch(r'\.[a-z0-9]{1,8}', ext) else ''
+
+class UploadStore:
+  # Content-addressed store: the document ID is the SHA-256 of the file, so the same
+  # RFP uploaded twice is stored once and maps onto the parse results already indexed
+  # for that digest. Least recently used uploads are evicted beyond the quota or max age.
+  def __init__(self, root: str=DEFAULT_UPLOAD_DIR, max_upload_bytes: int=DEFAULT_MAX_UPLOAD_BYTES,
+               quota_bytes: int=DEFAULT_QUOTA_BYTES, max_age: Optional[float]=DEFAULT_MAX_AGE) -> None:
+    self.root = root
+    self.objects_dir = os.path.join(root, 'objects')
+    self.max_upload_bytes = max_upload_bytes
+    self.quota_bytes = quota_bytes
+    self.max_age = max_age
+    os.makedirs(self.objects_dir, exist_ok=True)
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(os.path.join(root, 'uploads.sqlite3'), timeout=30, check_same_thread=False)
+    with self._lock, self._conn:
+      self._conn.execute('PRAGMA journal_mode=WAL')
+      self._conn.execute(
+        'CREATE TABLE IF NOT EXISTS uploads ('
+        ' digest TEXT PRIMARY KEY, filename TEXT NOT NULL, ext TEXT NOT NULL, size INTEGER NOT NULL,'
+        ' created_at REAL NOT NULL, last_used_at REAL NOT NULL)'
+      )
+      self._conn.execute('CREATE INDEX IF NOT EXISTS uploads_last_used ON uploads (last_used_at)')
+
+  def _object_path(self, digest: str, ext: str) -> str:
+    return os.path.join(self.objects_dir, digest[:2], digest + ext)
+
+  def save(self, stream: IO[bytes], filename: str) -> dict:
+    # Streams the upload to a temporary file in chunks while hashing it, then
+    # moves it into place unless a file with the same digest is already stored
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+    try:
+      with os.fdopen(fd, 'wb') as tmp:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+          size += len(chunk)
+          if size > self.max_upload_bytes:
+            raise UploadTooLargeError(f'Error: Upload exceeds the {self.max_upload_bytes} byte limit.')
+          digest.update(chunk)
+          tmp.write(chunk)
+      document_id = digest.hexdigest()
+      now = time.time()
+      with self._lock, self._conn:
+        row = self._conn.execute('SELECT ext FROM uploads WHERE digest = ?', (document_id,)).fetchone()
+        if row is not None and os.path.isfile(self._object_path(document_id, row[0])):
+          self._conn.execute('UPDATE uploads SET last_used_at = ? WHERE digest = ?', (now, document_id))
+          ext, deduplicated = row[0], True
+        else:
+          ext, deduplicated = _extension(filename), False
+          path = self._object_path(document_id, ext)
+          os.makedirs(os.path.dirname(path), exist_ok=True)
+          os.replace(tmp_path, path)
+          self._conn.execute(
+            'INSERT OR REPLACE INTO uploads (digest, filename, ext, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (document_id, filename or document_id, ext, size, now, now)
+          )
+    finally:
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    self.evict(keep=document_id)
+    return {'document_id': document_id, 'path': self._object_path(document_id, ext), 'filename': filename,
+            'size': size, 'deduplicated': deduplicated}
+
+  def path(self, document_id: str) -> Optional[str]:
+    # Path of a stored upload, or None if the ID is unknown or was evicted
+    if not DOCUMENT_ID.match(document_id or ''):
+      return None
+    with self._lock, self._conn:
+      row = self._conn.execute('SELECT ext FROM uploads WHERE digest = ?', (document_id,)).fetchone()
+      if row is None:
+        return None
+      path = self._object_path(document_id, row[0])
+      if not os.path.isfile(path):
+        self._conn.execute('DELETE FROM uploads WHERE digest = ?', (document_id,))
+        return None
+      self._conn.execute('UPDATE uploads SET last_used_at = ? WHERE digest = ?', (time.time(), document_id))
+    return path
+
+  def digest_of(self, path: str) -> Optional[str]:
+    # The SHA-256 of a file inside the store is its name, so callers can skip rehashing it
+    if os.path.dirname(os.path.dirname(os.path.abspath(path))) != os.path.abspath(self.objects_dir):
+      return None
+    digest = os.path.splitext(os.path.basename(path))[0]
+    return digest if DOCUMENT_ID.match(digest) else None
+
+  def evict(self, keep: Optional[str]=None) -> int:
+    # Drops uploads older than max_age, then least recently used ones until under the quota
+    removed = []
+    with self._lock, self._conn:
+      rows = self._conn.execute('SELECT digest, ext, size, last_used_at FROM uploads ORDER BY last_used_at').fetchall()
+      total = sum(row[2] for row in rows)
+      cutoff = time.time() - self.max_age if self.max_age is not None else None
+      for digest, ext, size, last_used_at in rows:
+        if digest == keep:
+          continue
+        if total <= self.quota_bytes and (cutoff is None or last_used_at >= cutoff):
+          break
+        removed.append(self._object_path(digest, ext))
+        total -= size
+        self._conn.execute('DELETE FROM uploads WHERE digest = ?', (digest,))
+    for path in removed:
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+    return len(removed)
+
+  def stats(self) -> dict:
+    with self._lock:
+      count, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM uploads').fetchone()
+    return {'uploads': count, 'bytes': total, 'quota_bytes': self.quota_bytes}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_upload_store() -> UploadStore:
+  global _store
+  with _store_lock:
+    if _store is None:
+      _store = UploadStore()
+    return _store
@@ -19,54 +19,78 @@ import Image from 'next/image'
 //   ]
 // }
 
-const findQuestions = async (file: File) => {
-  try {
+const uploadFile = async (file: File) => {
+  const formData = new FormData();
+  formData.append('file', file);
 
-    // Create FormData object
-    const formData = new FormData();
-    formData.append('file', file);
+  const uploadResponse = await fetch('http://localhost:5001/upload', {
+    method: 'POST',
+    body: formData
+  });
 
-    // First, upload the file to get its path
-    const uploadResponse = await fetch('http://localhost:5001/upload', {
-      method: 'POST',
-      body: formData
-    });
-    
-    if (!uploadResponse.ok) {
-      throw new Error(`Upload failed! status: ${uploadResponse.status}`);
-    }
-    const { filePath } = await uploadResponse.json();
+  if (!uploadResponse.ok) {
+    throw new Error(`Upload failed! status: ${uploadResponse.status}`);
+  }
+  // Uploads are stored by content, so the same file always gets the same documentId
+  const { documentId } = await uploadResponse.json();
+  return documentId as string;
+}
 
+type JobAnswer = { index: number; question: string; answer: string | null; error: string | null }
+
+// Submits the questionnaire as a background job and follows its progress over Server-Sent Events
+const runJob = async (
+  file: File,
+  chatbotUrl: string,
+  onQuestions: (questions: string[]) => void,
+  onAnswer: (answer: JobAnswer) => void,
+  onUploaded: (documentId: string) => void
+) => {
+  const documentId = await uploadFile(file);
+  onUploaded(documentId);
+
+  const response = await fetch('http://localhost:5001/jobs', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      document_id: documentId,
+      chatbot_link: chatbotUrl
+    })
+  });
 
-    console.log("Hello, World!");
+  const data = await response.json();
+  if (!response.ok || data.error) {
+    throw new Error(data.error || `Job request failed! status: ${response.status}`);
+  }
 
-    const response = await fetch('http://localhost:5001/parse', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        doc_path: filePath
-      })
+  await new Promise<void>((resolve, reject) => {
+    const events = new EventSource(`http://localhost:5001/jobs/${data.job_id}/events`);
+    events.addEventListener('questions', (e) => onQuestions(JSON.parse((e as MessageEvent).data).questions));
+    events.addEventListener('answer', (e) => onAnswer(JSON.parse((e as MessageEvent).data)));
+    events.addEventListener('done', () => {
+      events.close();
+      resolve();
     });
-    
-    console.log("Received response");
-    if (!response.ok) {
-      throw new Error(`HTTP error! status: ${response.status}`);
-    }
-
-    const data = await response.json();
-    
-    if (data.error) {
-      throw new Error(data.error);
-    }
-
-    return data.questions;
-
-  } catch (error) {
-    console.error('Error in findQuestions:', error);
-    throw error;
-  }
+    events.addEventListener('failed', (e) => {
+      events.close();
+      reject(new Error(JSON.parse((e as MessageEvent).data).error));
+    });
+    // EventSource retries on its own; give up once it stops or the server no longer knows the job
+    events.onerror = async () => {
+      if (events.readyState !== EventSource.CLOSED) {
+        try {
+          const job = await fetch(`http://localhost:5001/jobs/${data.job_id}`);
+          if (job.ok) return;
+        } catch {
+          // Server unreachable
+        }
+      }
+      events.close();
+      reject(new Error('Lost the connection to the job. The server may have restarted; please try again.'));
+    };
+  });
 }
 
 const getAnswer = async (question: string, chatbotUrl: string) => {
@@ -101,7 +125,7 @@ const getAnswer = async (question: string, chatbotUrl: string) => {
 }
 
 type Step = 'upload' | 'processing' | 'review'
-type Status = 'waiting' | 'processing' | 'done'
+type Status = 'waiting' | 'processing' | 'done' | 'failed'
 
 export function AutoOracle() {
   const [step, setStep] = useState<Step>('upload')
@@ -115,7 +139,9 @@ export function AutoOracle() {
     compileResults: 'waiting' as Status
   })
   const [currentQuestion, setCurrentQuestion] = useState(0)
+  const [jobError, setJobError] = useState<string | null>(null)
   const [fileUrl, setFileUrl] = useState<string>('');
+  const [documentId, setDocumentId] = useState<string>('');
   const [isEditing, setIsEditing] = useState<Record<string, boolean>>({});
   const [followUpQuestion, setFollowUpQuestion] = useState('');
   const [isLoadingAnswer, setIsLoadingAnswer] = useState(false);
@@ -145,47 +171,41 @@ export function AutoOracle() {
     if (!file) return
 
     setStep('processing')
+    setJobError(null)
     
-    // Find questions
+    // Find questions, then answers stream in one by one as the server finishes them
     setProcessStatus(prev => ({ ...prev, findQuestions: 'processing' }))
-    const foundQuestions = await findQuestions(file)
-    setQuestions(foundQuestions)
-    setProcessStatus(prev => ({ ...prev, findQuestions: 'done', answerQuestions: 'processing' }))
-
-    // Get answers
-    const newAnswers: Record<string, string> = {}
-    
-    // First, start all API calls without delay
-    const answerPromises = foundQuestions.map((question: string) => 
-      getAnswer(question, chatbotUrl)
-    );
-
-    // Then, update progress with delay while answers are being fetched
-    const updateProgressWithDelay = async () => {
-      for (let i = 0; i < foundQuestions.length; i++) {
-        await new Promise(resolve => setTimeout(resolve, 5000));
-        setCurrentQuestion(i + 1);
-      }
-    };
-
-    // Run both processes
-    const [answers] = await Promise.all([
-      Promise.all(answerPromises),
-      updateProgressWithDelay()
-    ]);
-
-    // Format results after all promises complete
-    const results = foundQuestions.map((question: string, index: number) => ({
-      question,
-      answer: answers[index]
-    }));
-
-    // Combine results into newAnswers object
-    results.forEach(({ question, answer }: { question: string, answer: string }) => {
-      newAnswers[question] = answer
-    })
-    setAnswers(newAnswers)
-    setProcessStatus(prev => ({ ...prev, answerQuestions: 'done', compileResults: 'done' }))
+    let answered = 0
+    try {
+      await runJob(
+        file,
+        chatbotUrl,
+        (foundQuestions) => {
+          setQuestions(foundQuestions)
+          setProcessStatus(prev => ({ ...prev, findQuestions: 'done', answerQuestions: 'processing' }))
+        },
+        ({ question, answer, error }) => {
+          answered += 1
+          setCurrentQuestion(answered)
+          setAnswers(prev => ({
+            ...prev,
+            [question]: error ? `Error: ${error}` : (answer ?? '')
+          }))
+        },
+        setDocumentId
+      )
+    } catch (error) {
+      console.error('Error processing questionnaire:', error)
+      // Stay on the progress screen and mark the stage that was running as failed
+      setJobError(error instanceof Error ? error.message : String(error))
+      setProcessStatus(prev => ({
+        ...prev,
+        findQuestions: prev.findQuestions === 'done' ? 'done' : 'failed',
+        answerQuestions: prev.answerQuestions === 'processing' ? 'failed' : prev.answerQuestions
+      }))
+      return
+    }
+    setProcessStatus(prev => ({ ...prev, findQuestions: 'done', answerQuestions: 'done', compileResults: 'done' }))
 
     // Move to review
     setStep('review')
@@ -245,7 +265,7 @@ export function AutoOracle() {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
-          documentName: file.name,
+          documentId,
           qaArray: questions.map(question => ({
             question,
             answer: answers[question]
@@ -395,8 +415,8 @@ export function AutoOracle() {
               <div className="space-y-2">
                 <div className="flex justify-between">
                   <span>Finding Questions</span>
-                  <span className={processStatus.findQuestions === 'done' ? 'text-green-500' : 'text-muted-foreground'}>
-                    {processStatus.findQuestions === 'done' ? 'Done' : 'Processing...'}
+                  <span className={processStatus.findQuestions === 'done' ? 'text-green-500' : processStatus.findQuestions === 'failed' ? 'text-red-500' : 'text-muted-foreground'}>
+                    {processStatus.findQuestions === 'done' ? 'Done' : processStatus.findQuestions === 'failed' ? 'Failed' : 'Processing...'}
                   </span>
                 </div>
                 <Progress value={processStatus.findQuestions === 'done' ? 100 : 60} />
@@ -405,8 +425,9 @@ export function AutoOracle() {
               <div className="space-y-2">
                 <div className="flex justify-between">
                   <span>Answering Questions</span>
-                  <span className="text-muted-foreground">
+                  <span className={processStatus.answerQuestions === 'failed' ? 'text-red-500' : 'text-muted-foreground'}>
                     {processStatus.answerQuestions === 'processing' ? `${currentQuestion}/${questions.length}` : ''}
+                    {processStatus.answerQuestions === 'failed' ? `Failed after ${currentQuestion}/${questions.length}` : ''}
                   </span>
                 </div>
                 <Progress 
@@ -424,6 +445,22 @@ export function AutoOracle() {
                 <Progress value={processStatus.compileResults === 'done' ? 100 : 0} />
               </div>
             </div>
+
+            {jobError && (
+              <div className="space-y-4">
+                <p className="text-sm text-red-500">Processing failed: {jobError}</p>
+                <div className="flex gap-4">
+                  <Button onClick={() => setStep('upload')} variant="outline">
+                    Back
+                  </Button>
+                  {Object.keys(answers).length > 0 && (
+                    <Button onClick={() => setStep('review')}>
+                      Review partial answers
+                    </Button>
+                  )}
+                </div>
+              </div>
+            )}
           </CardContent>
         </Card>
       </div>
@@ -1,37 +1,144 @@
 import argparse
 import os
+import time
+from functools import partial
 from questionnaire_parser import parse_questionnaire
-from knowledge_base_query import query_knowledge_base
-from output_handler import write_to_csv
+from knowledge_base_query import submit_query, BatchingSubmitter, HedgePolicy, BATCH_POLICIES, DEFAULT_BATCH_POLICY, DEFAULT_BATCH_TOKEN_BUDGET, HEDGE_BUDGET, HEDGE_PERCENTILE
+from answer_engine import answer_questions, DEFAULT_CONCURRENCY
+from answer_cache import get_answer_cache
+from aihub_client import configure_concurrency, configure_client
+from output_handler import CsvStream
+from batch_runner import is_batch, expand_questionnaires, run_batch, DEFAULT_PARSE_WORKERS
+from metrics import enable_tracing, write_summary
+from question_dedup import group_questions
 
 def main():
     parser = argparse.ArgumentParser(description='Process a questionnaire and query a knowledge base.')
-    parser.add_argument('--questionnaire', required=True, help='Path to the questionnaire document')
+    parser.add_argument('--questionnaire', required=True, help='Path to the questionnaire document, or a directory/glob of documents to process as a batch')
     parser.add_argument('--chatbot_link', required=True, help='Link to the knowledge base API')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Maximum number of questions sent to the knowledge base at once')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the local answer cache and document index')
+    parser.add_argument('--resume', action='store_true', help='Skip questions already answered by an interrupted run')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached answers but store the fresh ones')
+    parser.add_argument('--api-root', help='AIHub API root (defaults to AIHUB_API_ROOT or https://aihub.instabase.com/api)')
+    parser.add_argument('--ib-context', help='AIHub context (defaults to IB-CONTEXT from the environment)')
+    parser.add_argument('--api-key', help='AIHub API key (defaults to API_KEY from the environment)')
+    parser.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS, help='Number of documents parsed at once in batch mode')
+    parser.add_argument('--batch-size', type=int, default=1, help='Pack up to this many questions into one chatbot query (1 sends each question on its own)')
+    parser.add_argument('--batch-policy', choices=BATCH_POLICIES, default=DEFAULT_BATCH_POLICY, help='Also start a new pack at each numbered section or when the token budget is reached')
+    parser.add_argument('--batch-token-budget', type=int, default=DEFAULT_BATCH_TOKEN_BUDGET, help='Approximate question tokens per pack with --batch-policy tokens')
+    parser.add_argument('--hedge', action='store_true', help='Send a duplicate of any query still running past the observed latency percentile; the first answer wins')
+    parser.add_argument('--hedge-percentile', type=float, default=HEDGE_PERCENTILE, help='Latency percentile after which a query is hedged')
+    parser.add_argument('--hedge-budget', type=float, default=HEDGE_BUDGET, help='Largest fraction of queries that may be duplicated')
+    parser.add_argument('--hedge-max', type=int, help='Hard cap on the number of duplicate queries in the run')
+    parser.add_argument('--hedge-model', help='Model name for the duplicate queries (defaults to the same model)')
+    parser.add_argument('--dedup', action='store_true', help='Ask near-duplicate questions once and copy the answer to every variant (recorded in a Group column)')
+    parser.add_argument('--dedup-threshold', type=float, help='Similarity needed to treat two questions as the same (default 0.6 shingle Jaccard, 0.85 cosine with embeddings)')
+    parser.add_argument('--dedup-embeddings', action='store_true', help='Compare questions with local sentence embeddings (needs sentence-transformers)')
+    parser.add_argument('--metrics-out', help='Where to write the JSON run summary with per-stage timings (defaults to output_docs/run_summary.json)')
+    parser.add_argument('--no-open', action='store_true', help="Don't open the output CSV when the run finishes (e.g. for scripts and benchmarks)")
+    parser.add_argument('--trace', help='Append a JSON line per pipeline span (parse, upload, question, query) to this file')
     
     args = parser.parse_args()
+    started = time.perf_counter()
+    output_dir = 'output_docs'
+    metrics_out = args.metrics_out or os.path.join(output_dir, 'run_summary.json')
+    if args.trace:
+        enable_tracing(args.trace)
+    configure_client(api_key=args.api_key, api_root=args.api_root, ib_context=args.ib_context)  # The client itself is only built if AIHub is needed
+    configure_concurrency(args.concurrency)  # Connection pools sized to the number of requests in flight
+    cache = None if args.no_cache else get_answer_cache()
+    hedge = HedgePolicy(args.hedge_percentile, args.hedge_budget, args.hedge_max, args.hedge_model) if args.hedge else None
+    submit_fn = partial(submit_query, cache=cache, refresh=args.refresh, hedge=hedge)
+    concurrency = args.concurrency
+    batcher = None
+    if args.batch_size > 1:
+        # --concurrency then counts chatbot queries in flight, each carrying up to --batch-size questions
+        batcher = submit_fn = BatchingSubmitter(args.batch_size, args.batch_policy, args.batch_token_budget, cache=cache,
+                                                refresh=args.refresh, hedge=hedge)
+        concurrency = args.concurrency * args.batch_size
+
+    def report_batching():
+        if batcher is None:
+            return None
+        stats = batcher.stats()
+        print(f"Batching: {stats['questions']} questions in {stats['round_trips']} queries "
+              f"({stats['round_trips_saved']} round-trips saved, {stats['single_queries']} sent individually)")
+        return stats
+
+    def report_hedging():
+        if hedge is None:
+            return None
+        stats = hedge.stats()
+        print(f"Hedging: {stats['hedged']} of {stats['queries']} queries duplicated, {stats['hedge_wins']} answered first by the duplicate")
+        return stats
+
+    # Batch mode: every document shares one parse pool, one query queue and one client
+    if is_batch(args.questionnaire):
+        paths = expand_questionnaires(args.questionnaire)
+        print(f"Questionnaires found: {len(paths)}")
+        summary = run_batch(paths, args.chatbot_link, output_dir=output_dir, concurrency=concurrency, submit_fn=submit_fn,
+                            parse_workers=args.parse_workers, use_index=not args.no_cache, resume=args.resume,
+                            dedup=args.dedup, dedup_threshold=args.dedup_threshold, dedup_embeddings=args.dedup_embeddings)
+        if cache is not None:
+            print(f"Answer cache: {cache.hits} hits, {cache.misses} misses")
+        write_summary(metrics_out, questionnaire=args.questionnaire, batch=summary, batching=report_batching(), hedging=report_hedging(),
+                      elapsed_seconds=round(time.perf_counter() - started, 3))
+        print(f"Run summary written to {metrics_out}")
+        return
     
     # Step 1: Identify questions
-    questions = parse_questionnaire(args.questionnaire)
+    questions = parse_questionnaire(args.questionnaire, use_index=not args.no_cache)
     print(f"Questions identified: {len(questions)}")
     
-    # Step 2: Query knowledge base for answers
-    answers = []
-    for i, question in enumerate(questions):
-        print("----")
-        print(f"Finding answer for question {i + 1}/{len(questions)}: '{question}'")
-        answer = query_knowledge_base(question, args.chatbot_link)
-        answers.append(answer)
-        print(f"Answer found: '{answer}'")
-    
-    # Step 3: Write output to CSV in output_docs folder
-    output_dir = 'output_docs'
+    # Step 2: Query knowledge base for answers, several questions at a time,
+    # streaming each one to the CSV in the output_docs folder as it completes
     os.makedirs(output_dir, exist_ok=True)  # Create the directory if it doesn't exist
     output_file = os.path.join(output_dir, 'output.csv')  # Specify the output file path
-    write_to_csv(questions, answers, output_file)  # Pass the output file path to the function
-    print(f"Output document generated with {len(answers)} questions answered.")
+    # Near-duplicate questions are grouped and only the first of each group is asked
+    groups = group_questions(questions, args.dedup_threshold, args.dedup_embeddings) if args.dedup else [[i] for i in range(len(questions))]
+    group_numbers = [None] * len(questions)
+    for number, members in enumerate(groups, 1):
+        for index in members:
+            group_numbers[index] = number
+    if args.dedup:
+        print(f"Dedup: {len(questions)} questions in {len(groups)} groups ({len(questions) - len(groups)} queries saved)")
+    stream = CsvStream(questions, output_file, resume=args.resume, groups=group_numbers if args.dedup else None)
+    if stream.completed:
+        print(f"Resuming: {len(stream.completed)} questions already answered")
+    remaining = [[i for i in members if i not in stream.completed] for members in groups]
+    remaining = [members for members in remaining if members]
+    failed = []
+
+    def report(position, result):
+        for index in remaining[position]:
+            stream.add(index, dict(result, question=questions[index]))
+            print("----")
+            print(f"Question {index + 1}/{len(questions)}: '{questions[index]}'")
+            if result['error'] is None:
+                print(f"Answer found: '{result['answer']}'")
+            else:
+                failed.append(index)
+                print(f"Failed to answer: {result['error']}")
+
+    try:
+        answer_questions([questions[members[0]] for members in remaining], args.chatbot_link, concurrency=concurrency, submit_fn=submit_fn, on_result=report)
+    finally:
+        stream.close()
+    if cache is not None:
+        print(f"Answer cache: {cache.hits} hits, {cache.misses} misses")
+    batching = report_batching()
+    hedging = report_hedging()
+    
+    # Step 3: Report on the output document and how long each stage took
+    print(f"Output document generated with {len(questions) - len(failed)} questions answered ({len(failed)} failed).")
+    write_summary(metrics_out, questionnaire=args.questionnaire, questions=len(questions), failed=len(failed),
+                  resumed=len(stream.completed), batching=batching, hedging=hedging, dedup_groups=len(groups) if args.dedup else None, elapsed_seconds=round(time.perf_counter() - started, 3))
+    print(f"Run summary written to {metrics_out}")
     
     # Step 4: Automatically open the output document
+    if args.no_open:
+        return
     try:
         if os.name == 'nt':  # For Windows
             os.startfile(output_file)
@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import os
+import time
+from answer_cache import normalize_question
+from answer_engine import answer_questions, DEFAULT_CONCURRENCY
+from output_handler import CsvStream, checkpoint_path, load_checkpoint
+from question_dedup import group_questions
+from questionnaire_parser import parse_questionnaire
+
+QUESTIONNAIRE_EXTENSIONS = ('.docx', '.doc', '.pdf')
+DEFAULT_PARSE_WORKERS = 4
+
+def is_batch(questionnaire):
+    # An existing file is a single questionnaire even if its name looks like a glob ("RFP [final].docx")
+    if os.path.isfile(questionnaire):
+        return False
+    return os.path.isdir(questionnaire) or glob.has_magic(questionnaire)
+
+def expand_questionnaires(questionnaire):
+    # A directory means every supported document in it; anything else is a glob pattern
+    if os.path.isdir(questionnaire):
+        paths = [os.path.join(questionnaire, name) for name in os.listdir(questionnaire)]
+    else:
+        paths = glob.glob(questionnaire, recursive=True)
+    return sorted(path for path in paths
+                  if os.path.isfile(path) and path.lower().endswith(QUESTIONNAIRE_EXTENSIONS)
+                  and not os.path.basename(path).startswith(('~$', '.~lock')))
+
+def _output_files(paths, output_dir):
+    # One CSV per input, named after the document; clashing names get a suffix
+    outputs, used = {}, set()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, n = stem, 1
+        while name in used:
+            n += 1
+            name = f'{stem}_{n}'
+        used.add(name)
+        outputs[path] = os.path.join(output_dir, f'{name}.csv')
+    return outputs
+
+def run_batch(paths, chatbot_link, output_dir='output_docs', concurrency=DEFAULT_CONCURRENCY, submit_fn=None,
+              parse_workers=DEFAULT_PARSE_WORKERS, use_index=True, resume=False, dedup=False, dedup_threshold=None,
+              dedup_embeddings=False):
+    start = time.monotonic()
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = _output_files(paths, output_dir)
+
+    # Step 1: Parse every questionnaire in parallel; one bad document doesn't stop the batch
+    def parse(path):
+        try:
+            return parse_questionnaire(path, use_index=use_index)
+        except Exception as e:
+            print(f"Failed to parse {path}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, parse_workers)) as executor:
+        parsed = dict(zip(paths, executor.map(parse, paths)))
+    documents = [path for path in paths if parsed[path] is not None]
+
+    # Step 2: Put every unanswered question of every document on one queue,
+    # asking each distinct question only once. With dedup, near-duplicates across
+    # all documents share a group (recorded in each CSV's Group column) as well.
+    entries = [(path, index) for path in documents for index in range(len(parsed[path]))]
+    if dedup:
+        groups = [[entries[k] for k in group]
+                  for group in group_questions([parsed[path][index] for path, index in entries], dedup_threshold, dedup_embeddings)]
+        group_numbers = {entry: number for number, group in enumerate(groups, 1) for entry in group}
+        print(f"Dedup: {len(entries)} questions in {len(groups)} groups ({len(entries) - len(groups)} queries saved)")
+    else:
+        exact = {}
+        for path, index in entries:
+            exact.setdefault(normalize_question(parsed[path][index]), []).append((path, index))
+        groups = list(exact.values())
+    completed = {path: load_checkpoint(parsed[path], checkpoint_path(outputs[path])) if resume else {} for path in documents}
+    queue, members = [], []
+    pending = {path: 0 for path in documents}
+    for group in groups:
+        remaining = [(path, index) for path, index in group if index not in completed[path]]
+        if remaining:
+            queue.append(parsed[remaining[0][0]][remaining[0][1]])
+            members.append(remaining)
+            for path, _ in remaining:
+                pending[path] += 1
+
+    # A document's CSV and checkpoint are only open while it has questions in flight, so a
+    # large directory doesn't run out of file handles
+    streams = {}
+
+    def open_stream(path):
+        if path not in streams:
+            streams[path] = CsvStream(parsed[path], outputs[path], resume=resume,
+                                      groups=[group_numbers[(path, index)] for index in range(len(parsed[path]))] if dedup else None)
+        return streams[path]
+
+    for path in documents:
+        if not pending[path]:
+            open_stream(path).close()  # Nothing left to ask: just write its CSV
+            del streams[path]
+
+    total = sum(len(parsed[path]) for path in documents)
+    print(f"Questions identified: {total} in {len(documents)} documents, {len(queue)} distinct to query")
+    failed = [0]
+
+    def fan_out(position, result):
+        if result['error'] is not None:
+            failed[0] += len(members[position])
+        for path, index in members[position]:
+            open_stream(path).add(index, dict(result, question=parsed[path][index]))
+            pending[path] -= 1
+            if not pending[path]:
+                streams.pop(path).close()
+
+    kwargs = {'submit_fn': submit_fn} if submit_fn is not None else {}
+    try:
+        answer_questions(queue, chatbot_link, concurrency=concurrency, on_result=fan_out, **kwargs)
+    finally:
+        for stream in list(streams.values()):
+            stream.close()
+
+    # Step 3: Aggregate throughput summary
+    elapsed = time.monotonic() - start
+    minutes = max(elapsed, 1e-9) / 60
+    summary = {
+        'documents': len(documents),
+        'failed_documents': len(paths) - len(documents),
+        'questions': total,
+        'queried': len(queue),
+        'dedup_groups': len(groups) if dedup else None,
+        'failed_questions': failed[0],
+        'elapsed_seconds': round(elapsed, 2),
+        'documents_per_minute': round(len(documents) / minutes, 2),
+        'questions_per_minute': round(total / minutes, 2),
+        'outputs': [outputs[path] for path in documents],
+    }
+    print(f"Batch finished in {summary['elapsed_seconds']}s: {summary['documents']} documents "
+          f"({summary['documents_per_minute']}/min), {summary['questions']} questions "
+          f"({summary['questions_per_minute']}/min), {summary['queried']} queried, "
+          f"{summary['failed_questions']} failed, {summary['failed_documents']} documents failed to parse")
+    return summary
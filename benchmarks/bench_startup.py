@@ -0,0 +1,60 @@
+# Startup-time guard: `auto_oracle.py --help` must stay fast and importing the CLI
+# or its modules must not load the AIHub SDK or read configuration.
+#
+#   python benchmarks/bench_startup.py [--runs 10] [--max-seconds 1.0] [--json out.json]
+#
+# Exits with status 1 if the median exceeds --max-seconds or the SDK is imported eagerly.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['aihub', 'dotenv', 'pydantic', 'urllib3']
+CHECK_IMPORTS = (
+    'import sys, auto_oracle, batch_runner, answer_engine;'
+    'print(",".join(m for m in %r if m in sys.modules))' % HEAVY_MODULES
+)
+
+def time_command(command, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure CLI startup time and guard against regressions.')
+    parser.add_argument('--runs', type=int, default=10, help='Number of timed runs')
+    parser.add_argument('--max-seconds', type=float, default=1.0, help='Fail if the median --help time exceeds this')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    baseline = time_command([sys.executable, '-c', 'pass'], args.runs)
+    help_times = time_command([sys.executable, 'auto_oracle.py', '--help'], args.runs)
+    eager = subprocess.run([sys.executable, '-c', CHECK_IMPORTS], cwd=ROOT, capture_output=True, text=True)
+    eager_modules = [m for m in eager.stdout.strip().split(',') if m] if eager.returncode == 0 else []
+
+    results = {
+        'runs': args.runs,
+        'interpreter_median_seconds': round(statistics.median(baseline), 4),
+        'help_median_seconds': round(statistics.median(help_times), 4),
+        'help_max_seconds': round(max(help_times), 4),
+        'eager_imports': eager_modules,
+        'import_check_error': eager.stderr.strip().splitlines()[-1] if eager.returncode != 0 else None,
+        'max_seconds': args.max_seconds,
+    }
+    results['passed'] = (results['help_median_seconds'] <= args.max_seconds and not eager_modules
+                         and results['import_check_error'] is None)
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if results['passed'] else 1)
+
+if __name__ == '__main__':
+    main()
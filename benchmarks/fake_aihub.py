@@ -0,0 +1,282 @@
+# Local stand-in for AIHub, for measuring throughput without spending credits.
+#
+# FakeBackend keeps the state (conversations, queries) and simulates latency,
+# RUNNING durations and errors. It can be used in-process through FakeAIHubClient,
+# which has the same queries/conversations methods the code calls on the SDK
+# client, or over HTTP with serve(), which exposes the AI Hub REST v2 routes the
+# SDK talks to (point AIHUB_API_ROOT / --api-root at it).
+#
+#   python benchmarks/fake_aihub.py --port 8765 --running-time lognormal:1.0,0.5
+import argparse
+from email import policy
+from email.parser import BytesParser
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+def parse_distribution(spec):
+    # 'const:0.2', 'uniform:0.1,0.5' or 'lognormal:<median>,<sigma>' -> function returning seconds
+    kind, _, params = spec.partition(':')
+    values = [float(v) for v in params.split(',') if v]
+    if kind == 'const':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f'Unknown distribution: {spec}')
+
+class FakeApiError(Exception):
+    def __init__(self, status, reason):
+        super().__init__(f'({status}) {reason}')
+        self.status = status
+        self.reason = reason
+
+def _answer(query):
+    # Batched queries (several numbered questions, JSON answer requested) get a JSON object back
+    if 'JSON object mapping each question number' in query:
+        numbered = re.findall(r'^(\d+)\. (.+)$', query, re.MULTILINE)
+        return json.dumps({number: f'Answer to: {question}' for number, question in numbered})
+    return f'Answer to: {query}'
+
+class FakeBackend:
+    def __init__(self, call_latency='const:0.02', running_time='lognormal:1.0,0.5', conversation_time='const:1.0',
+                 query_error_rate=0.0, http_error_rate=0.0, questions_per_document=20, seed=None):
+        self.call_latency = parse_distribution(call_latency)
+        self.running_time = parse_distribution(running_time)
+        self.conversation_time = parse_distribution(conversation_time)
+        self.query_error_rate = query_error_rate
+        self.http_error_rate = http_error_rate
+        self.questions_per_document = questions_per_document
+        self.random = random.Random(seed)
+        self.calls = {}
+        self.queries = {}
+        self.conversations = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        # Every API call pays the simulated latency and may fail with a transient error
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            fail = self.random.random() < self.http_error_rate
+        time.sleep(self.call_latency())
+        if fail:
+            raise FakeApiError(503, 'Service Unavailable')
+
+    def run_query(self, query, model_name=None):
+        self._call('queries.run')
+        now = time.monotonic()
+        with self._lock:
+            query_id = f'q{next(self._ids)}'
+            self.queries[query_id] = {
+                'query': query,
+                'model_name': model_name,
+                'submitted_at': now,
+                'ready_at': now + self.running_time(),
+                'failed': self.random.random() < self.query_error_rate,
+                'observed_at': None,
+            }
+        return query_id
+
+    def query_status(self, query_id):
+        self._call('queries.status')
+        now = time.monotonic()
+        with self._lock:
+            query = self.queries[query_id]
+            if now < query['ready_at']:
+                return {'status': 'RUNNING', 'results': [], 'error': None}
+            if query['observed_at'] is None:
+                query['observed_at'] = now
+        if query['failed']:
+            return {'status': 'FAILED', 'results': [], 'error': 'Simulated query failure'}
+        return {'status': 'COMPLETE', 'results': [{'response': _answer(query['query'])}], 'error': None}
+
+    def create_conversation(self, name, files):
+        self._call('conversations.create')
+        with self._lock:
+            conversation_id = f'c{next(self._ids)}'
+            self.conversations[conversation_id] = {'name': name, 'documents': [], 'ready_at': 0}
+        self.add_documents(conversation_id, files, count=False)
+        return conversation_id
+
+    def add_documents(self, conversation_id, files, count=True):
+        if count:
+            self._call('conversations.add_documents')
+        with self._lock:
+            conversation = self.conversations[conversation_id]
+            for name in files:
+                conversation['documents'].append({'id': f'd{next(self._ids)}', 'name': name})
+            conversation['ready_at'] = time.monotonic() + self.conversation_time()
+
+    def conversation_status(self, conversation_id):
+        self._call('conversations.status')
+        with self._lock:
+            conversation = self.conversations[conversation_id]
+            state = 'RUNNING' if time.monotonic() < conversation['ready_at'] else 'COMPLETE'
+            return {'id': conversation_id, 'state': state, 'documents': list(conversation['documents'])}
+
+    def converse(self, conversation_id, question):
+        self._call('conversations.converse')
+        time.sleep(self.running_time())
+        numbered = re.findall(r'^(\d+)\. ', question, re.M)
+        if numbered:  # Ambiguous-line classification from the local extractor: all are questions
+            return json.dumps([int(n) for n in numbered])
+        return json.dumps([f'Question {i + 1}: is requirement {i + 1} supported?' for i in range(self.questions_per_document)])
+
+    def stats(self):
+        # Per-question latency is submit -> first status call that saw the result
+        with self._lock:
+            latencies = [q['observed_at'] - q['submitted_at'] for q in self.queries.values() if q['observed_at'] is not None]
+            return {'calls': dict(self.calls), 'queries': len(self.queries), 'latencies': latencies}
+
+def _ns(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _ns(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_ns(v) for v in value]
+    return value
+
+class _FakeQueries:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def run(self, query, source_app=None, model_name=None, include_source_info=False):
+        return SimpleNamespace(query_id=self._backend.run_query(query, model_name))
+
+    def status(self, query_id):
+        return _ns(self._backend.query_status(query_id))
+
+class _FakeConversations:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def create(self, name, description=None, files=()):
+        return SimpleNamespace(id=self._backend.create_conversation(name, list(files)))
+
+    def add_documents(self, conversation_id, files=()):
+        self._backend.add_documents(conversation_id, list(files))
+
+    def status(self, conversation_id):
+        return _ns(self._backend.conversation_status(conversation_id))
+
+    def converse(self, conversation_id, question, document_ids=None):
+        return SimpleNamespace(prompt_id=uuid.uuid4().hex, answer=self._backend.converse(conversation_id, question))
+
+class FakeAIHubClient:
+    # In-process replacement for aihub.AIHub covering the calls this project makes
+    def __init__(self, backend):
+        self.backend = backend
+        self.queries = _FakeQueries(backend)
+        self.conversations = _FakeConversations(backend)
+
+class _Handler(BaseHTTPRequestHandler):
+    backend = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _files(self):
+        # Multipart upload -> (form fields, uploaded file names); the contents are discarded
+        length = int(self.headers.get('Content-Length') or 0)
+        head = f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode('utf-8')
+        message = BytesParser(policy=policy.default).parsebytes(head + self.rfile.read(length))
+        fields, files = {}, []
+        for part in message.iter_parts():
+            if part.get_filename():
+                files.append(part.get_filename())
+            else:
+                fields[part.get_param('name', header='content-disposition')] = part.get_content()
+        return fields, files
+
+    def _dispatch(self, method):
+        path = self.path.split('?')[0].rstrip('/')
+        try:
+            if method == 'POST' and path.endswith('/v2/queries'):
+                body = self._json()
+                return self._send(200, {'query_id': self.backend.run_query(body.get('query'), body.get('model_name'))})
+            match = re.search(r'/v2/queries/([^/]+)$', path)
+            if method == 'GET' and match:
+                return self._send(200, self.backend.query_status(match.group(1)))
+            if method == 'POST' and path.endswith('/v2/conversations'):
+                fields, files = self._files()
+                conversation_id = self.backend.create_conversation(fields.get('name', ''), files)
+                return self._send(200, {'id': conversation_id, 'name': fields.get('name', '')})
+            match = re.search(r'/v2/conversations/([^/]+)/documents$', path)
+            if method == 'POST' and match:
+                _, files = self._files()
+                self.backend.add_documents(match.group(1), files)
+                return self._send(200, {})
+            match = re.search(r'/v2/conversations/([^/]+)/prompts$', path)
+            if method == 'POST' and match:
+                body = self._json()
+                return self._send(200, {'prompt_id': uuid.uuid4().hex, 'answer': self.backend.converse(match.group(1), body.get('question', ''))})
+            match = re.search(r'/v2/conversations/([^/]+)$', path)
+            if method == 'GET' and match:
+                return self._send(200, self.backend.conversation_status(match.group(1)))
+            return self._send(404, {'error': f'Unknown route {method} {path}'})
+        except FakeApiError as e:
+            return self._send(e.status, {'error': e.reason})
+        except KeyError as e:
+            return self._send(404, {'error': f'Not found: {e}'})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+def serve(backend, host='127.0.0.1', port=0):
+    # Starts the HTTP stand-in on a background thread; returns (server, api_root)
+    handler = type('Handler', (_Handler,), {'backend': backend})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}/api'
+
+def add_backend_arguments(parser):
+    parser.add_argument('--call-latency', default='const:0.02', help='Latency of every API call (const:/uniform:/lognormal:)')
+    parser.add_argument('--running-time', default='lognormal:1.0,0.5', help='How long a query stays RUNNING')
+    parser.add_argument('--conversation-time', default='const:1.0', help='How long document processing takes')
+    parser.add_argument('--query-error-rate', type=float, default=0.0, help='Fraction of queries that finish as FAILED')
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help='Fraction of API calls that fail with a 503')
+    parser.add_argument('--seed', type=int, help='Random seed for error injection')
+
+def backend_from_args(args, questions_per_document=20):
+    return FakeBackend(args.call_latency, args.running_time, args.conversation_time, args.query_error_rate,
+                       args.http_error_rate, questions_per_document, args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the AIHub API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    server, api_root = serve(backend_from_args(args), args.host, args.port)
+    print(f'Fake AIHub listening on {api_root}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
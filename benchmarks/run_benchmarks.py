@@ -0,0 +1,199 @@
+# Offline benchmark harness: runs the CLI (auto_oracle.main), the Flask job API and the
+# docx fill path against the fake AIHub at several questionnaire sizes and concurrency
+# settings, and writes machine-readable results for comparing versions.
+#
+#   python benchmarks/run_benchmarks.py --sizes 10,100 --concurrency 1,8 --output results.json
+#
+# Each run happens in its own subprocess so peak RSS is measured per run.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+SERVER_DIR = os.path.join(ROOT, 'api-call-server')
+CHATBOT_LINK = 'https://aihub.instabase.com/hub/apps/benchmark-chatbot'
+SCENARIOS = ('cli', 'flask', 'fill')
+
+def make_questionnaire(path, size):
+    # A .docx with `size` questions: numbered paragraphs and a form table, half each
+    def paragraph(text):
+        return f'<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+    def row(*cells):
+        return '<w:tr>' + ''.join(f'<w:tc>{paragraph(c) if c else "<w:p/>"}</w:tc>' for c in cells) + '</w:tr>'
+
+    questions = [f'{i + 1}. Does the platform support requirement {i + 1}?' for i in range(size)]
+    half = size // 2
+    body = [paragraph('Vendor questionnaire')] + [paragraph(q) for q in questions[:half]]
+    body.append('<w:tbl>' + row('Question', 'Answer') + ''.join(row(q, '') for q in questions[half:]) + '</w:tbl>')
+    xml = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+           '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+           + ''.join(body) + '<w:sectPr/></w:body></w:document>')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr('[Content_Types].xml', '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>')
+        docx.writestr('word/document.xml', xml)
+    return questions
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def _install_client(args, backend):
+    import aihub_client
+    from fake_aihub import FakeAIHubClient, serve
+    aihub_client.shared_limiter.rate = args.requests_per_second
+    aihub_client.shared_limiter.burst = max(aihub_client.shared_limiter.burst, int(args.requests_per_second))
+    if args.transport == 'http':
+        # Real SDK against the HTTP stand-in
+        _, api_root = serve(backend)
+        aihub_client.configure_client(api_key='benchmark', api_root=api_root, ib_context='benchmark')
+    else:
+        aihub_client.set_client(aihub_client.resilient(FakeAIHubClient(backend)))
+    aihub_client.configure_concurrency(args.concurrency)
+
+def _run_cli(args, doc_path, questions):
+    import auto_oracle
+    sys.argv = ['auto_oracle.py', '--questionnaire', doc_path, '--chatbot_link', CHATBOT_LINK,
+                '--concurrency', str(args.concurrency), '--no-cache', '--no-open']
+    with contextlib.redirect_stdout(io.StringIO()):
+        auto_oracle.main()
+
+def _run_flask(args, doc_path, questions):
+    sys.path.insert(0, SERVER_DIR)
+    import run_app
+    run_app.job_manager.concurrency = args.concurrency
+    client = run_app.app.test_client()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with open(doc_path, 'rb') as f:
+            response = client.post('/jobs', data={'file': (f, os.path.basename(doc_path)), 'chatbot_link': CHATBOT_LINK},
+                                   content_type='multipart/form-data')
+        job_id = response.get_json()['job_id']
+        after = 0
+        while True:
+            poll = client.get(f'/jobs/{job_id}/poll?after={after}&timeout=5').get_json()
+            after = poll['next']
+            if poll['status'] in ('done', 'failed'):
+                break
+
+def _run_fill(args, doc_path, questions):
+    sys.path.insert(0, SERVER_DIR)
+    from genarate_docs import fill_docx_with_qa
+    qa_pairs = [(question, f'Answer to: {question}') for question in questions]
+    with contextlib.redirect_stdout(io.StringIO()):
+        fill_docx_with_qa(doc_path, qa_pairs, output=io.BytesIO())
+
+def run_worker(args):
+    sys.path[:0] = [ROOT, BENCH_DIR]
+    from fake_aihub import backend_from_args
+    result = {'scenario': args.worker, 'size': args.size, 'concurrency': args.concurrency, 'transport': args.transport}
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ['AUTO_ORACLE_CACHE_DIR'] = os.path.join(workdir, 'cache')
+        os.chdir(workdir)
+        doc_path = os.path.join(workdir, f'questionnaire_{args.size}.docx')
+        questions = make_questionnaire(doc_path, args.size)
+        backend = backend_from_args(args, questions_per_document=args.size)
+        runner = {'cli': _run_cli, 'flask': _run_flask, 'fill': _run_fill}[args.worker]
+        try:
+            if args.worker != 'fill':
+                _install_client(args, backend)
+            start = time.perf_counter()
+            runner(args, doc_path, questions)
+            result['wall_seconds'] = round(time.perf_counter() - start, 4)
+        except ImportError as e:
+            result['skipped'] = f'Missing dependency: {e.name}'
+        stats = backend.stats()
+    latencies = stats['latencies']
+    status_calls = stats['calls'].get('queries.status', 0)
+    result.update({
+        'questions': args.size,
+        'queries': stats['queries'],
+        'calls': stats['calls'],
+        'latency_p50': percentile(latencies, 0.50),
+        'latency_p95': percentile(latencies, 0.95),
+        'latency_p99': percentile(latencies, 0.99),
+        'status_calls_per_answer': round(status_calls / stats['queries'], 3) if stats['queries'] else None,
+        'questions_per_second': round(args.size / result['wall_seconds'], 3) if result.get('wall_seconds') else None,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+    })
+    with open(args.result_file, 'w') as f:
+        json.dump(result, f)
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    from fake_aihub import add_backend_arguments
+    parser = argparse.ArgumentParser(description='Benchmark auto-oracle against a local fake AIHub.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma separated: cli, flask, fill')
+    parser.add_argument('--sizes', default='10,100', help='Comma separated questionnaire sizes')
+    parser.add_argument('--concurrency', default='1,8', help='Comma separated concurrency settings')
+    parser.add_argument('--transport', choices=('inprocess', 'http'), default='inprocess',
+                        help='Fake client in-process, or the real SDK against the HTTP stand-in')
+    parser.add_argument('--requests-per-second', type=float, default=10.0, help='Client rate limit during the run')
+    parser.add_argument('--output', default='bench_results.json', help='Where to write the JSON results')
+    parser.add_argument('--worker', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.concurrency = int(args.concurrency)
+        return run_worker(args)
+
+    passthrough = ['--transport', args.transport, '--requests-per-second', str(args.requests_per_second),
+                   '--call-latency', args.call_latency, '--running-time', args.running_time,
+                   '--conversation-time', args.conversation_time, '--query-error-rate', str(args.query_error_rate),
+                   '--http-error-rate', str(args.http_error_rate)] + (['--seed', str(args.seed)] if args.seed is not None else [])
+    results = []
+    for scenario in args.scenarios.split(','):
+        # Filling doesn't talk to AIHub, so concurrency doesn't apply
+        concurrencies = ['1'] if scenario == 'fill' else args.concurrency.split(',')
+        for size in args.sizes.split(','):
+            for concurrency in concurrencies:
+                with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+                    result_file = f.name
+                command = [sys.executable, os.path.abspath(__file__), '--worker', scenario, '--size', size,
+                           '--concurrency', concurrency, '--result-file', result_file] + passthrough
+                run = subprocess.run(command, capture_output=True, text=True)
+                if run.returncode == 0:
+                    with open(result_file) as f:
+                        result = json.load(f)
+                else:
+                    result = {'scenario': scenario, 'size': int(size), 'concurrency': int(concurrency),
+                              'error': (run.stderr.strip().splitlines() or ['unknown error'])[-1]}
+                os.unlink(result_file)
+                results.append(result)
+                print(json.dumps(result))
+
+    report = {
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'settings': {k: v for k, v in vars(args).items() if k not in ('worker', 'size', 'result_file', 'output')},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from answer_cache import DEFAULT_CACHE_DIR
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    # Hash the file in chunks so large documents aren't read into memory at once
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _prompt_key(prompt):
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+class DocumentIndex:
+    # Maps a document's SHA-256 to the AIHub conversation/document it was uploaded
+    # to and the questions extracted from it, so unchanged files are never re-uploaded
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, 'documents.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS documents ('
+                ' sha256 TEXT PRIMARY KEY, path TEXT NOT NULL, conversation_id TEXT NOT NULL,'
+                ' document_id TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS documents_path ON documents (path, updated_at)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS questions ('
+                ' sha256 TEXT NOT NULL, prompt_key TEXT NOT NULL, questions TEXT NOT NULL,'
+                ' PRIMARY KEY (sha256, prompt_key))'
+            )
+
+    def lookup(self, sha256):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT conversation_id, document_id FROM documents WHERE sha256 = ?', (sha256,)
+            ).fetchone()
+        return None if row is None else {'conversation_id': row[0], 'document_id': row[1]}
+
+    def lookup_path(self, path):
+        # Most recent upload of any version of the file at this path
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT conversation_id, document_id, sha256 FROM documents WHERE path = ? ORDER BY updated_at DESC LIMIT 1',
+                (os.path.abspath(path),)
+            ).fetchone()
+        return None if row is None else {'conversation_id': row[0], 'document_id': row[1], 'sha256': row[2]}
+
+    def record(self, sha256, path, conversation_id, document_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)',
+                (sha256, os.path.abspath(path), conversation_id, document_id, time.time())
+            )
+
+    def forget(self, sha256):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM documents WHERE sha256 = ?', (sha256,))
+            self._conn.execute('DELETE FROM questions WHERE sha256 = ?', (sha256,))
+
+    def questions(self, sha256, prompt):
+        # Questions depend on the prompt used to extract them, so they are keyed on both
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT questions FROM questions WHERE sha256 = ? AND prompt_key = ?', (sha256, _prompt_key(prompt))
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def record_questions(self, sha256, prompt, questions):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO questions VALUES (?, ?, ?)', (sha256, _prompt_key(prompt), json.dumps(questions))
+            )
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_document_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DocumentIndex()
+        return _index
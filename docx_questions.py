@@ -0,0 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+QUESTION = 'question'
+AMBIGUOUS = 'ambiguous'
+NOT_QUESTION = 'not_question'
+
+# Ambiguous lines are sent to the LLM in chunks of at most this many characters
+MAX_CHUNK_CHARS = 4000
+CHUNK_WORKERS = 4
+# Asking about ambiguous lines usually means uploading and processing the whole document
+# first, so a handful (e.g. a lone "Vendor Name:" label) are just kept as questions instead
+MIN_AMBIGUOUS_TO_ASK = 3
+
+QUESTION_WORDS = {'who', 'what', 'when', 'where', 'why', 'how', 'which', 'is', 'are', 'do', 'does', 'did', 'can',
+                  'could', 'will', 'would', 'should', 'has', 'have', 'may', 'must'}
+IMPERATIVES = {'describe', 'provide', 'explain', 'list', 'please', 'state', 'specify', 'indicate', 'confirm', 'outline',
+               'detail', 'identify', 'include', 'attach', 'submit', 'summarize', 'summarise', 'tell', 'name', 'enter'}
+NUMBERING = re.compile(r'^\s*(?:q(?:uestion)?\s*)?\(?(?:\d+(?:\.\d+)*|[a-z]|[ivx]+)[.):]\s*|^\s*(?:q(?:uestion)?\s*)?\d+(?:\.\d+)*\s+', re.I)
+MAX_LABEL_WORDS = 25
+
+# Raised for files that aren't a readable .docx
+LOCAL_PARSE_ERRORS = (zipfile.BadZipFile, KeyError, ET.ParseError)
+
+CLASSIFY_PROMPT = 'Below are numbered lines from a questionnaire document. A line is a question if it asks the respondent for information in any form: a question, a statement, a field name or an instruction. Return exactly a list of the numbers of the lines that are questions, e.g. [3, 7]. If none of them are questions, return exactly an empty list []. Do not include any other information in the output.\n\n'
+
+def iter_blocks(docx_path):
+    # Stream word/document.xml and yield one block per body paragraph or table row:
+    # ('paragraph', text, numbered, style) or ('row', [cell texts], False, None)
+    rows = []  # Open table rows, innermost last
+    cells = []  # Paragraph texts of the open table cells, innermost last
+    with zipfile.ZipFile(docx_path) as docx, docx.open('word/document.xml') as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            tag = elem.tag
+            if event == 'start':
+                if tag == W + 'tr':
+                    rows.append([])
+                elif tag == W + 'tc':
+                    cells.append([])
+                continue
+
+            if tag == W + 'p':
+                text = _paragraph_text(elem)
+                if cells:
+                    cells[-1].append(text)
+                else:
+                    numbered = elem.find(f'{W}pPr/{W}numPr') is not None
+                    style = elem.find(f'{W}pPr/{W}pStyle')
+                    yield 'paragraph', text, numbered, style.get(W + 'val') if style is not None else None
+                elem.clear()
+            elif tag == W + 'tc':
+                rows[-1].append('\n'.join(t for t in cells.pop() if t).strip())
+                elem.clear()
+            elif tag == W + 'tr':
+                row = rows.pop()
+                if cells:  # Nested table: flatten it into the enclosing cell
+                    cells[-1].append(' | '.join(c for c in row if c))
+                else:
+                    yield 'row', row, False, None
+                elem.clear()
+
+def _paragraph_text(paragraph):
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == W + 't' and node.text:
+            parts.append(node.text)
+        elif node.tag in (W + 'tab', W + 'br'):
+            parts.append(' ')
+    return re.sub(r'\s+', ' ', ''.join(parts)).strip()
+
+def classify_text(text, numbered=False):
+    stripped = text.strip()
+    if len(stripped) < 3:
+        return NOT_QUESTION
+    if stripped.endswith('?'):
+        return QUESTION
+    words = NUMBERING.sub('', stripped).split()
+    first = words[0].lower().strip('(:,') if words else ''
+    if first in IMPERATIVES:
+        return QUESTION
+    if numbered or NUMBERING.match(stripped) or first in QUESTION_WORDS or stripped.endswith(':'):
+        return AMBIGUOUS
+    return NOT_QUESTION
+
+def classify_row(cells):
+    # Leading cells that only hold a number are part of the label, not the question
+    texts = list(cells)
+    prefix = []
+    while texts and re.fullmatch(r'(\d+(\.\d+)*|[A-Za-z])[.)]?', texts[0]):
+        prefix.append(texts.pop(0))
+    if not texts or not texts[0]:
+        return NOT_QUESTION, None
+    label = ' '.join(prefix + [texts[0]])
+    for text in texts:
+        if text and classify_text(text) == QUESTION:
+            return QUESTION, text if text is not texts[0] else label
+    # A short label followed only by empty cells is a field waiting for an answer
+    if len(texts) > 1 and not any(texts[1:]) and len(texts[0].split()) <= MAX_LABEL_WORDS:
+        return QUESTION, label
+    if classify_text(texts[0]) == AMBIGUOUS:
+        return AMBIGUOUS, label
+    return NOT_QUESTION, None
+
+def classify_blocks(blocks):
+    # Returns (kind, text) per block; a label ending in ':' followed by an empty
+    # paragraph is a form field and counts as a question
+    blocks = list(blocks)
+    classified = []
+    for i, (block_type, content, numbered, style) in enumerate(blocks):
+        if block_type == 'row':
+            classified.append(classify_row(content))
+            continue
+        if style and style.lower().startswith(('heading', 'title')):
+            classified.append((NOT_QUESTION, None))
+            continue
+        kind = classify_text(content, numbered)
+        if kind == AMBIGUOUS and content.endswith(':') and i + 1 < len(blocks) and blocks[i + 1][0] == 'paragraph' and not blocks[i + 1][1]:
+            kind = QUESTION
+        classified.append((kind, content if kind != NOT_QUESTION else None))
+    return classified
+
+def _chunks(candidates, max_chars):
+    chunk, size = [], 0
+    for position, text in candidates:
+        if chunk and size + len(text) > max_chars:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append((position, text))
+        size += len(text) + 8
+    if chunk:
+        yield chunk
+
+def extract_questions(docx_path, ask_fn=None, max_chunk_chars=MAX_CHUNK_CHARS, min_ambiguous=MIN_AMBIGUOUS_TO_ASK):
+    # Find questions locally; only lines the heuristics can't decide on are sent to
+    # ask_fn(prompt) -> list of line numbers in bounded chunks, once there are at least
+    # min_ambiguous of them. Otherwise, and for any chunk ask_fn fails on, they are kept.
+    classified = classify_blocks(iter_blocks(docx_path))
+    keep = {i for i, (kind, _) in enumerate(classified) if kind == QUESTION}
+    ambiguous = [(i, text) for i, (kind, text) in enumerate(classified) if kind == AMBIGUOUS]
+
+    if ask_fn is None or len(ambiguous) < min_ambiguous:
+        keep.update(i for i, _ in ambiguous)
+    elif ambiguous:
+        def classify_chunk(chunk):
+            lines = '\n'.join(f'{n + 1}. {text}' for n, (_, text) in enumerate(chunk))
+            try:
+                numbers = {int(n) for n in ask_fn(CLASSIFY_PROMPT + lines) if str(n).strip().isdigit()}
+            except Exception as e:
+                # The questions found locally are still good; keep this chunk's lines undecided
+                print(f"Could not classify {len(chunk)} lines with AIHub, keeping them: {e}")
+                return [position for position, _ in chunk]
+            return [position for n, (position, _) in enumerate(chunk) if n + 1 in numbers]
+
+        with ThreadPoolExecutor(max_workers=CHUNK_WORKERS) as executor:
+            for positions in executor.map(classify_chunk, list(_chunks(ambiguous, max_chunk_chars))):
+                keep.update(positions)
+
+    # Questions are returned in document order
+    return [classified[i][1] for i in sorted(keep)]
@@ -1,20 +1,64 @@
 # Importing necessary library
-from aihub import AIHub  # Added import for AIHub
-import os  # Added import for os
-from dotenv import load_dotenv  # Added import for load_dotenv
-import time  # Added import for time
 from urllib.parse import urlparse  # Added import for URL parsing
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+import collections
+import json
+import re
+import threading
+import time
+from status_poller import get_poller
+from aihub_client import CircuitOpenError, get_client  # Shared client, created on first use
+from metrics import registry, start_span
 
-# Load environment variables from .env file
-load_dotenv()  # Added to load environment variables
+DEFAULT_MODEL_NAME = 'multistep-lite'
+QUERY_RETRIES = 1  # Times a query that finished as failed is submitted again
 
-# Initialize the API client with the API key from .env
-client = AIHub(api_key=os.getenv("API_KEY"), api_root="https://aihub.instabase.com/api", ib_context=os.getenv("IB-CONTEXT"))  # Added client initialization
+queries = registry.counter('queries_total', 'Questions answered, by where the answer came from and outcome')
+submit_seconds = registry.histogram('query_submit_seconds', 'Time to submit a query, including rate limiting')
+query_seconds = registry.histogram('query_seconds', 'Time from submitting a question to having its answer')
+batch_queries = registry.counter('batch_queries_total', 'Chatbot queries carrying several questions')
+batch_fallbacks = registry.counter('batch_fallbacks_total', 'Questions a batch did not answer cleanly, retried on their own')
+hedges_total = registry.counter('hedged_queries_total', 'Duplicate queries sent because the first one was slow')
+hedge_wins_total = registry.counter('hedge_wins_total', 'Hedged duplicates that answered before the original query')
 
-def query_knowledge_base(question, chatbot_link):  # Added chatbot_link parameter
+# Optional hedging: a slow query gets a duplicate once it passes the observed latency percentile
+HEDGE_PERCENTILE = 0.95
+HEDGE_BUDGET = 0.1  # At most this fraction of queries may be duplicated
+HEDGE_MIN_SAMPLES = 20  # Latencies observed before any query is hedged
+HEDGE_WINDOW = 500  # Recent latencies the percentile is taken over
+HEDGE_SUBMIT_WORKERS = 4  # Duplicates being submitted at once (each may wait on the rate limiter and retries)
+
+# Optional batching: several questions per chatbot query (see BatchingSubmitter)
+DEFAULT_BATCH_SIZE = 5
+BATCH_POLICIES = ('count', 'section', 'tokens')  # Also close a pack on a new section / at the token budget
+DEFAULT_BATCH_POLICY = 'count'
+DEFAULT_BATCH_TOKEN_BUDGET = 1500
+BATCH_LINGER = 0.05  # Seconds a partial pack waits for more questions before it is sent
+BATCH_PROMPT = ('Answer each of the following numbered questions separately and completely. '
+                'Respond only with a JSON object mapping each question number to its answer, for example '
+                '{{"1": "answer to question 1", "2": "answer to question 2"}}. '
+                'Leave out the number of any question you cannot answer.\n\n{questions}')
+
+class QueryFailedError(ValueError):
+    pass
+
+def parse_chatbot_id(chatbot_link):
     # Extract the chatbot ID from the chatbot_link
     parsed_url = urlparse(chatbot_link)
-    chatbot_id = parsed_url.path.split('/')[-1]  # Get the last part of the path as the ID
+    return parsed_url.path.split('/')[-1]  # Get the last part of the path as the ID
+
+def _answer_from_status(status_response):
+    # Parse the chatbot answer
+    if status_response.status == 'COMPLETE':
+        for result in status_response.results:
+            return result.response  # Return the chatbot's answer
+    else:
+        raise QueryFailedError(f"Error: {status_response.error}")  # Handle errors
+
+def _run_query(aihub_client, chatbot_id, text, model_name, retries, span_name='query'):
+    # Submits one chatbot query and returns a Future for its raw answer; the shared
+    # poller checks the status in the background so no thread sleeps while waiting
+    future = Future()
 
     # Define the source_app with the chatbot ID
     source_app = {
@@ -22,26 +66,432 @@ def query_knowledge_base(question, chatbot_link):  # Added chatbot_link paramete
         'id': chatbot_id  # Use the extracted chatbot ID
     }
 
-    # Send a query to the chatbot
-    response = client.queries.run(
-        query=question,
-        source_app=source_app,
-        model_name='multistep-lite',  # Optional: specify the model
-        include_source_info=False  # Optional: specify if you want source info
-    )
-    
-    # Get the query ID to check the status
-    query_id = response.query_id
-
-    # Check query status until an answer is ready
-    status_response = client.queries.status(query_id)
-    while status_response.status == 'RUNNING':
-        time.sleep(5)  # Wait before checking again
-        status_response = client.queries.status(query_id)
+    started = time.perf_counter()
+    span = start_span(span_name, question=text[:200], chatbot_id=chatbot_id, model_name=model_name)
+    query_id_of = [None]  # Latest AIHub query ID, for the trace
+    status_of = [None]
 
-    # Parse the chatbot answer
-    if status_response.status == 'COMPLETE':
-        for result in status_response.results:
-            return result.response  # Return the chatbot's answer
+    def record(outcome, **attributes):
+        # Runs exactly once: either the Future got its result/error, or it was cancelled
+        query_seconds.observe(time.perf_counter() - started)
+        queries.inc(source='aihub', outcome=outcome)
+        span.end(query_id=query_id_of[0], **attributes)
+
+    def stop_polling(f):
+        # Cancelling the Future (e.g. the losing half of a hedged pair) stops its polling
+        if f.cancelled():
+            if status_of[0] is not None:
+                status_of[0].cancel()
+            record('cancelled', cancelled=True)
+
+    future.add_done_callback(stop_polling)
+
+    def attempt(retries_left):
+        # Send a query to the chatbot (rate limiting and transport retries happen in the client)
+        with submit_seconds.time():
+            response = aihub_client.queries.run(
+                query=text,
+                source_app=source_app,
+                model_name=model_name,  # Optional: specify the model
+                include_source_info=False  # Optional: specify if you want source info
+            )
+        
+        # Get the query ID to check the status
+        query_id = response.query_id
+        query_id_of[0] = query_id
+
+        # Check query status until an answer is ready
+        status_future = get_poller().track(
+            lambda: aihub_client.queries.status(query_id),
+            lambda status_response: status_response.status == 'RUNNING',
+            _answer_from_status,
+            kind='query'
+        )
+        status_of[0] = status_future
+        status_future.add_done_callback(lambda f: finish(f, retries_left))
+
+    def done(answer=None, error=None):
+        try:
+            if error is None:
+                future.set_result(answer)
+            else:
+                future.set_exception(error)
+        except InvalidStateError:
+            return  # Cancelled in the meantime; stop_polling has recorded it
+        record('ok' if error is None else 'error', error=None if error is None else str(error))
+
+    def finish(status_future, retries_left):
+        if status_future.cancelled():
+            return
+        error = status_future.exception()
+        if error is None:
+            done(status_future.result())
+        elif isinstance(error, QueryFailedError) and retries_left > 0:
+            # A query that finished as failed is worth one more try before giving up
+            try:
+                attempt(retries_left - 1)
+            except Exception as e:
+                done(error=e)
+        else:
+            done(error=error)
+
+    try:
+        attempt(retries)
+    except Exception as e:
+        done(error=e)
+    return future
+
+class HedgePolicy:
+    # Decides when a slow query gets a duplicate: once it has been running longer than
+    # the given percentile of recently observed latencies, as long as the budget
+    # (a fraction of all queries, optionally capped) isn't spent. The duplicate can use
+    # a lighter model_name. Shared by every query of a run.
+    def __init__(self, percentile=HEDGE_PERCENTILE, budget=HEDGE_BUDGET, max_hedges=None, model_name=None,
+                 min_samples=HEDGE_MIN_SAMPLES, window=HEDGE_WINDOW):
+        self.percentile = percentile
+        self.budget = budget
+        self.max_hedges = max_hedges
+        self.model_name = model_name
+        self.min_samples = min_samples
+        self.queries = 0
+        self.hedges = 0
+        self.wins = 0
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def threshold(self):
+        # Seconds after which a query is hedged, or None while there is too little data
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+    def started(self):
+        with self._lock:
+            self.queries += 1
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def try_hedge(self):
+        with self._lock:
+            if self.max_hedges is not None and self.hedges >= self.max_hedges:
+                return False
+            if self.hedges + 1 > self.budget * self.queries:
+                return False
+            self.hedges += 1
+        hedges_total.inc()
+        return True
+
+    def won(self):
+        with self._lock:
+            self.wins += 1
+        hedge_wins_total.inc()
+
+    def stats(self):
+        threshold = self.threshold()
+        with self._lock:
+            return {'queries': self.queries, 'hedged': self.hedges, 'hedge_wins': self.wins,
+                    'hedge_rate': round(self.hedges / self.queries, 4) if self.queries else 0.0,
+                    'threshold_seconds': None if threshold is None else round(threshold, 3)}
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+def _get_hedge_executor():
+    # Duplicates are submitted here, off the poller's workers, so a submission stuck on the
+    # rate limiter or retry backoff never holds up status polling
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_SUBMIT_WORKERS, thread_name_prefix='hedge-submit')
+        return _hedge_executor
+
+def _hedged_query(aihub_client, chatbot_id, text, model_name, retries, hedge):
+    # Runs the query and, if it is still going after the policy's threshold, a duplicate.
+    # The first answer wins and the other query is abandoned; an error only counts
+    # once neither query can still answer. Resolves to (answer, model that answered).
+    future = Future()
+    started = time.perf_counter()
+    attempts = []
+    launching = [False]  # A duplicate is being submitted and may still answer
+    timer = [None]  # Pending hedge deadline on the shared poller
+    lock = threading.Lock()
+    hedge.started()
+
+    def settle(attempt, is_hedge):
+        if attempt.cancelled():
+            return
+        error = attempt.exception()
+        with lock:
+            if future.done():
+                return
+            if error is not None and (launching[0] or any(not other.done() for other in attempts if other is not attempt)):
+                return
+            if timer[0] is not None:
+                timer[0].cancel()
+            if error is None:
+                future.set_result((attempt.result(), hedge.model_name or model_name if is_hedge else model_name))
+            else:
+                future.set_exception(error)
+            others = [other for other in attempts if other is not attempt]
+        for other in others:
+            other.cancel()
+        if error is None:
+            hedge.record(time.perf_counter() - started)
+            if is_hedge:
+                hedge.won()
+
+    def launch_hedge():
+        with lock:
+            if future.done() or not hedge.try_hedge():
+                return
+            launching[0] = True
+        # Submitting waits on the rate limiter, so it happens outside the lock that settle needs
+        try:
+            duplicate = _run_query(aihub_client, chatbot_id, text, hedge.model_name or model_name, retries, span_name='hedge_query')
+        except Exception:
+            duplicate = None
+        with lock:
+            launching[0] = False
+            if duplicate is not None:
+                attempts.append(duplicate)
+            already_settled = future.done()
+        if duplicate is None:
+            if primary.done():
+                settle(primary, False)  # The primary may have failed while the duplicate was being sent
+        elif already_settled:
+            duplicate.cancel()
+        else:
+            duplicate.add_done_callback(lambda f: settle(f, True))
+
+    primary = _run_query(aihub_client, chatbot_id, text, model_name, retries)
+    attempts.append(primary)
+    threshold = hedge.threshold()
+    if threshold is not None:
+        timer[0] = get_poller().call_later(threshold, lambda: _get_hedge_executor().submit(launch_hedge))
+    primary.add_done_callback(lambda f: settle(f, False))
+    return future
+
+def _cache_answer(cache, chatbot_id, question, model_name, answer):
+    # A cache that can't be written (locked database, full disk) only costs a future lookup
+    try:
+        cache.put(chatbot_id, question, model_name, answer)
+    except Exception as e:
+        print(f"Could not cache the answer to '{question}': {e}")
+
+def submit_query(question, chatbot_link, aihub_client=None, cache=None, refresh=False, model_name=DEFAULT_MODEL_NAME, retries=QUERY_RETRIES, hedge=None):
+    # Send the query and return a Future for its answer.
+    # With a cache, known answers are returned without a round-trip unless refresh is set.
+    # With a HedgePolicy, a query that runs unusually long is duplicated
+    aihub_client = aihub_client or get_client()
+    chatbot_id = parse_chatbot_id(chatbot_link)
+    future = Future()
+
+    if cache is not None and not refresh:
+        answer = cache.get(chatbot_id, question, model_name)
+        if answer is not None:
+            queries.inc(source='cache', outcome='ok')
+            future.set_result(answer)
+            return future
+
+    def store(query_future, hedged=False):
+        error = query_future.exception()
+        if error is not None:
+            future.set_exception(error)
+            return
+        # A hedge won by a lighter model is cached under that model, not the one asked for
+        answer, answered_by = query_future.result() if hedged else (query_future.result(), model_name)
+        future.set_result(answer)
+        if cache is not None and answer is not None:
+            _cache_answer(cache, chatbot_id, question, answered_by, answer)
+
+    if hedge is None:
+        _run_query(aihub_client, chatbot_id, question, model_name, retries).add_done_callback(store)
+    else:
+        _hedged_query(aihub_client, chatbot_id, question, model_name, retries, hedge).add_done_callback(lambda f: store(f, hedged=True))
+    return future
+
+def query_knowledge_base(question, chatbot_link, aihub_client=None, cache=None, refresh=False, model_name=DEFAULT_MODEL_NAME):  # Added chatbot_link parameter
+    return submit_query(question, chatbot_link, aihub_client, cache, refresh, model_name).result()
+
+def _estimate_tokens(text):
+    return len(text) // 4 + 1  # Rough, but good enough to keep a batch under the budget
+
+def _section_of(question):
+    # "3.2 Do you..." belongs to section 3; questions without sub-numbering stay in the current section
+    match = re.match(r'^\s*(?:q(?:uestion)?\s*)?(\d+)\.\d+', question, re.IGNORECASE)
+    return match.group(1) if match else None
+
+def format_batch(questions):
+    numbered = '\n'.join(f'{number}. {question}' for number, question in enumerate(questions, 1))
+    return BATCH_PROMPT.format(questions=numbered)
+
+def parse_batch_answer(answer, count):
+    # Maps question positions (0-based) to their answers; anything missing, empty or
+    # unparseable is left out so the caller can ask that question on its own
+    text = (answer or '').strip().strip('`').strip()
+    if text.startswith('json'):
+        text = text[len('json'):].strip()
+    start, end = text.find('{'), text.rfind('}')
+    try:
+        parsed = json.loads(text[start:end + 1]) if start != -1 and end > start else None
+    except ValueError:
+        parsed = None
+    if not isinstance(parsed, dict):
+        return {}
+    answers = {}
+    for key, value in parsed.items():
+        try:
+            position = int(str(key).strip().rstrip('.')) - 1
+        except ValueError:
+            continue
+        if 0 <= position < count and isinstance(value, str) and value.strip():
+            answers[position] = value.strip()
+    return answers
+
+class BatchingSubmitter:
+    # Drop-in submit_fn that packs up to max_questions questions into one chatbot query
+    # with a JSON answer format, then splits the response back into per-question answers.
+    # Questions missing from the response are retried individually. A pack is sent when
+    # it is full, when the policy closes it (new section, token budget) or after linger seconds.
+    def __init__(self, max_questions=DEFAULT_BATCH_SIZE, policy=DEFAULT_BATCH_POLICY, token_budget=DEFAULT_BATCH_TOKEN_BUDGET,
+                 linger=BATCH_LINGER, aihub_client=None, cache=None, refresh=False, model_name=DEFAULT_MODEL_NAME, retries=QUERY_RETRIES,
+                 hedge=None):
+        if policy not in BATCH_POLICIES:
+            raise ValueError(f"Error: Unknown batch policy {policy!r}, expected one of {', '.join(BATCH_POLICIES)}.")
+        self.max_questions = max(1, max_questions)
+        self.policy = policy
+        self.token_budget = token_budget
+        self.linger = linger
+        self.aihub_client = aihub_client
+        self.cache = cache
+        self.refresh = refresh
+        self.model_name = model_name
+        self.retries = retries
+        self.hedge = hedge  # Applied to questions sent on their own
+        self.questions = 0  # Questions sent to AIHub (cache hits excluded)
+        self.batch_queries = 0
+        self.single_queries = 0  # Packs of one plus individual retries of questions a batch didn't answer
+        self._pending = []
+        self._pending_link = None
+        self._pending_section = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def __call__(self, question, chatbot_link):
+        future = Future()
+        if self.cache is not None and not self.refresh:
+            answer = self.cache.get(parse_chatbot_id(chatbot_link), question, self.model_name)
+            if answer is not None:
+                queries.inc(source='cache', outcome='ok')
+                future.set_result(answer)
+                return future
+
+        section = _section_of(question) if self.policy == 'section' else None
+        ready = []
+        with self._lock:
+            self.questions += 1
+            if self._pending and self._closes_pack(chatbot_link, section, question):
+                ready.append(self._take_pack())
+            if not self._pending:
+                self._pending_link = chatbot_link
+                self._timer = threading.Timer(self.linger, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            if section is not None:
+                self._pending_section = section
+            self._pending.append((question, future))
+            if len(self._pending) >= self.max_questions:
+                ready.append(self._take_pack())
+        for pack in ready:
+            self._send(*pack)
+        return future
+
+    def _closes_pack(self, chatbot_link, section, question):
+        if chatbot_link != self._pending_link:
+            return True
+        if section is not None and self._pending_section is not None and section != self._pending_section:
+            return True
+        if self.policy == 'tokens':
+            used = sum(_estimate_tokens(pending) for pending, _ in self._pending)
+            return used + _estimate_tokens(question) > self.token_budget
+        return False
+
+    def _take_pack(self):
+        pack = (self._pending, self._pending_link)
+        self._pending, self._pending_section = [], None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return pack
+
+    def flush(self):
+        # Sends whatever is waiting without lingering any longer
+        with self._lock:
+            pack = self._take_pack()
+        self._send(*pack)
+
+    def _send(self, pending, chatbot_link):
+        if not pending:
+            return
+        if len(pending) == 1:
+            self._send_single(pending[0][0], chatbot_link, pending[0][1])
+            return
+        with self._lock:
+            self.batch_queries += 1
+        batch_queries.inc()
+        try:
+            client = self.aihub_client or get_client()
+            batch_future = _run_query(client, parse_chatbot_id(chatbot_link), format_batch([q for q, _ in pending]),
+                                      self.model_name, self.retries, span_name='batch_query')
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        batch_future.add_done_callback(lambda f: self._split(f, pending, chatbot_link))
+
+    def _send_single(self, question, chatbot_link, future):
+        with self._lock:
+            self.single_queries += 1
+        try:
+            single = submit_query(question, chatbot_link, self.aihub_client, self.cache, self.refresh, self.model_name, self.retries,
+                                  self.hedge)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        single.add_done_callback(lambda f: _copy_result(f, future))
+
+    def _split(self, batch_future, pending, chatbot_link):
+        error = batch_future.exception()
+        if isinstance(error, CircuitOpenError):
+            # AIHub is being shed; N single queries would only be rejected the same way
+            for _, future in pending:
+                future.set_exception(error)
+            return
+        answers = {} if error is not None else parse_batch_answer(batch_future.result(), len(pending))
+        chatbot_id = parse_chatbot_id(chatbot_link)
+        for position, (question, future) in enumerate(pending):
+            if position in answers:
+                future.set_result(answers[position])
+                if self.cache is not None:
+                    _cache_answer(self.cache, chatbot_id, question, self.model_name, answers[position])
+            else:
+                batch_fallbacks.inc()
+                self._send_single(question, chatbot_link, future)
+
+    def stats(self):
+        # Round-trips saved compared with one query per question
+        with self._lock:
+            round_trips = self.batch_queries + self.single_queries
+            return {'questions': self.questions, 'batch_queries': self.batch_queries, 'single_queries': self.single_queries,
+                    'round_trips': round_trips, 'round_trips_saved': self.questions - round_trips}
+
+def _copy_result(source, target):
+    error = source.exception()
+    if error is None:
+        target.set_result(source.result())
     else:
-        raise ValueError(f"Error: {status_response.error}")  # Handle errors
+        target.set_exception(error)
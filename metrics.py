@@ -0,0 +1,180 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RESERVOIR_SIZE = 2048  # Recent observations kept per series for the JSON summary's percentiles
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+def _summary_key(key):
+    return ','.join(f'{k}={v}' for k, v in key) or 'total'
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * fraction)))] if ordered else None
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def prometheus(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            lines += [f'{self.name}{_format_labels(key)} {value}' for key, value in sorted(self._values.items())]
+        return lines
+
+    def summary(self):
+        with self._lock:
+            return {_summary_key(key): value for key, value in sorted(self._values.items())}
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0, 'recent': []})
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+            series['recent'].append(value)
+            if len(series['recent']) > RESERVOIR_SIZE:
+                del series['recent'][:len(series['recent']) - RESERVOIR_SIZE]
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def prometheus(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series['counts']):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_format_labels(key, [("le", bound)])} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {series["sum"]}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {series["count"]}')
+        return lines
+
+    def summary(self):
+        with self._lock:
+            return {
+                _summary_key(key): {
+                    'count': series['count'],
+                    'sum': round(series['sum'], 6),
+                    'mean': round(series['sum'] / series['count'], 6) if series['count'] else None,
+                    'p50': _percentile(series['recent'], 0.5),
+                    'p95': _percentile(series['recent'], 0.95),
+                    'p99': _percentile(series['recent'], 0.99),
+                } for key, series in sorted(self._series.items())
+            }
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, *args):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, help_text, *args)
+            return self._metrics[name]
+
+    def counter(self, name, help_text=''):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text='', buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets)
+
+    def prometheus(self):
+        # Text exposition format served at /metrics
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(line for metric in metrics for line in metric.prometheus()) + '\n'
+
+    def summary(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.summary() for metric in metrics}
+
+# Process-wide registry used by every stage of the pipeline
+registry = Registry()
+
+# Optional tracing: spans are appended as JSON lines to the file given to enable_tracing
+# (or the AUTO_ORACLE_TRACE environment variable)
+_trace_file = None
+_trace_lock = threading.Lock()
+
+def enable_tracing(path):
+    global _trace_file
+    with _trace_lock:
+        _trace_file = open(path, 'a')
+
+class Span:
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+
+    def end(self, **attributes):
+        if _trace_file is None:
+            return
+        record = {'name': self.name, 'start': self.start, 'duration': time.time() - self.start,
+                  'thread': threading.current_thread().name, 'attributes': dict(self.attributes, **attributes)}
+        with _trace_lock:
+            _trace_file.write(json.dumps(record, default=str) + '\n')
+            _trace_file.flush()
+
+def start_span(name, **attributes):
+    # For work that starts and finishes in different places (e.g. a polled query)
+    return Span(name, attributes)
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    current = Span(name, attributes)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=str(e))
+        raise
+    current.end()
+
+def write_summary(path, **extra):
+    # JSON run summary for the CLI: every counter and timer plus anything passed in
+    with open(path, 'w') as f:
+        json.dump(dict(extra, metrics=registry.summary()), f, indent=2)
+
+if os.getenv('AUTO_ORACLE_TRACE'):
+    enable_tracing(os.getenv('AUTO_ORACLE_TRACE'))
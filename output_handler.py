@@ -1,8 +1,93 @@
 import csv
+import json
+import os
+import threading
+from metrics import registry
 
-def write_to_csv(questions, answers, output_file='output.csv'):
-    with open(output_file, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['Question', 'Answer'])
-        for question, answer in zip(questions, answers):
-            writer.writerow([question, answer])
\ No newline at end of file
+CHECKPOINT_SCAN_BYTES = 4096  # Read backwards this much at a time looking for the last complete line
+
+write_seconds = registry.histogram('csv_write_seconds', 'Time spent checkpointing and writing answers to the CSV')
+
+def checkpoint_path(output_file):
+    return output_file + '.checkpoint.jsonl'
+
+def load_checkpoint(questions, checkpoint_file):
+    # Only successful answers to the same question at the same position are reused
+    completed = {}
+    if not os.path.exists(checkpoint_file):
+        return completed
+    with open(checkpoint_file) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash
+            index = entry.get('index')
+            if (isinstance(index, int) and 0 <= index < len(questions)
+                    and entry.get('question') == questions[index] and entry.get('error') is None):
+                completed[index] = {'question': entry['question'], 'answer': entry.get('answer'), 'error': None}
+    return completed
+
+class CsvStream:
+    # Writes answers as they arrive, in question order, flushing after every row.
+    # Each finished answer is also appended to a JSONL checkpoint so an interrupted
+    # run can be resumed without asking the knowledge base again.
+    def __init__(self, questions, output_file='output.csv', checkpoint_file=None, resume=False, groups=None):
+        # groups, if given, holds each question's duplicate group number for a Group column
+        self.questions = questions
+        self.groups = groups
+        self.checkpoint_file = checkpoint_file or checkpoint_path(output_file)
+        self.completed = load_checkpoint(questions, self.checkpoint_file) if resume else {}
+        if resume:
+            self._drop_partial_line()
+        self._lock = threading.Lock()
+        self._next = 0
+        self._pending = {}
+        self._checkpoint = open(self.checkpoint_file, mode='a' if resume else 'w')
+        self._file = open(output_file, mode='w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(['Question', 'Answer', 'Error'] + (['Group'] if groups is not None else []))
+        for index, result in sorted(self.completed.items()):
+            self.add(index, result, checkpoint=False)
+
+    def _drop_partial_line(self):
+        # Cut a last line left without its newline by a crash, so the next entry
+        # doesn't get appended onto it and become unreadable as well
+        if not os.path.exists(self.checkpoint_file):
+            return
+        with open(self.checkpoint_file, 'rb+') as f:
+            end = position = f.seek(0, os.SEEK_END)
+            while position > 0:
+                step = min(CHECKPOINT_SCAN_BYTES, position)
+                f.seek(position - step)
+                newline = f.read(step).rfind(b'\n')
+                if newline != -1:
+                    position += newline + 1 - step
+                    break
+                position -= step
+            if position < end:
+                f.truncate(position)
+
+    def add(self, index, result, checkpoint=True):
+        with self._lock, write_seconds.time():
+            if checkpoint:
+                self._checkpoint.write(json.dumps(dict(result, index=index)) + '\n')
+                self._checkpoint.flush()
+            self._pending[index] = result
+            # Rows are written as soon as every earlier question is done
+            while self._next in self._pending:
+                self._write_row(self._next, self._pending.pop(self._next))
+                self._next += 1
+            self._file.flush()
+
+    def _write_row(self, index, row):
+        group = [self.groups[index]] if self.groups is not None else []
+        self._writer.writerow([row['question'], row['answer'], row['error'] or ''] + group)
+
+    def close(self):
+        with self._lock:
+            for index in sorted(self._pending):
+                self._write_row(index, self._pending[index])
+            self._pending.clear()
+            self._file.close()
+            self._checkpoint.close()
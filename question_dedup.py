@@ -0,0 +1,111 @@
+import random
+import re
+import zlib
+from answer_cache import normalize_question
+
+# Questions whose estimated Jaccard similarity (character shingles) reaches the
+# threshold are asked once. 0.6 catches rewordings of the same sentence without
+# merging questions that merely share a topic.
+DEFAULT_THRESHOLD = 0.6
+DEFAULT_EMBEDDING_THRESHOLD = 0.85  # Cosine similarity, with --dedup-embeddings
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+SHINGLE_SIZE = 4
+NUM_PERMUTATIONS = 64
+BANDS = 32  # LSH bands of NUM_PERMUTATIONS // BANDS rows; candidate pairs are then checked exactly
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)  # Fixed seed so the grouping is the same on every run
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'describe', 'do', 'does', 'for', 'how', 'if', 'in',
+    'is', 'it', 'of', 'on', 'or', 'please', 'provide', 'the', 'to', 'what', 'which', 'with', 'you', 'your',
+}
+
+def _tokens(question):
+    # Normalized words without filler, with a crude suffix strip so "encrypt"/"encryption" meet
+    words = re.findall(r'[a-z0-9]+', normalize_question(question))
+    return [re.sub(r'(ions?|ing|ed|es|s)$', '', word) or word for word in words if word not in STOPWORDS]
+
+def _numbers(question):
+    # "requirement 4" and "requirement 5" are different questions however similar the text
+    return frozenset(re.findall(r'\d+', normalize_question(question)))
+
+def shingles(question, size=SHINGLE_SIZE):
+    text = ' '.join(sorted(_tokens(question)))  # Word order doesn't matter for "at-rest encryption" vs "encrypt ... at rest"
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def minhash(shingle_set):
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingle_set]
+    if not hashes:
+        return None
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            # The earlier question stays the root, so it becomes the group's representative
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+def _candidate_pairs(signatures):
+    # Locality sensitive hashing: questions sharing any band of their signature are candidates
+    rows = NUM_PERMUTATIONS // BANDS
+    pairs = set()
+    for band in range(BANDS):
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            if signature is not None:
+                buckets.setdefault(signature[band * rows:(band + 1) * rows], []).append(i)
+        for members in buckets.values():
+            pairs.update((members[a], members[b]) for a in range(len(members)) for b in range(a + 1, len(members)))
+    return pairs
+
+def _embedding_pairs(questions, threshold, model_name):
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        raise ImportError("Error: --dedup-embeddings needs the sentence-transformers package (pip install sentence-transformers).")
+    vectors = SentenceTransformer(model_name).encode(questions, normalize_embeddings=True)
+    similarity = vectors @ vectors.T
+    return {(i, j) for i in range(len(questions)) for j in range(i + 1, len(questions)) if similarity[i][j] >= threshold}
+
+def group_questions(questions, threshold=None, embeddings=False, embedding_model=DEFAULT_EMBEDDING_MODEL):
+    # Returns groups of question indices, each in question order and ordered by their
+    # first member. The first member is the representative that actually gets asked.
+    uf = _UnionFind(len(questions))
+    # Exact duplicates after normalization always share a group
+    seen = {}
+    for i, question in enumerate(questions):
+        uf.union(seen.setdefault(normalize_question(question), i), i)
+
+    numbers = [_numbers(question) for question in questions]
+    if embeddings:
+        pairs = _embedding_pairs(questions, DEFAULT_EMBEDDING_THRESHOLD if threshold is None else threshold, embedding_model)
+    else:
+        threshold = DEFAULT_THRESHOLD if threshold is None else threshold
+        shingle_sets = [shingles(question) for question in questions]
+        pairs = [(i, j) for i, j in _candidate_pairs([minhash(s) for s in shingle_sets])
+                 if jaccard(shingle_sets[i], shingle_sets[j]) >= threshold]
+    for i, j in pairs:
+        if numbers[i] == numbers[j]:
+            uf.union(i, j)
+
+    groups = {}
+    for i in range(len(questions)):
+        groups.setdefault(uf.find(i), []).append(i)
+    return sorted(groups.values(), key=lambda members: members[0])
@@ -1,61 +1,181 @@
 # Importing necessary libraries
-from aihub import AIHub
+import ast
+import threading
 import time
-from dotenv import load_dotenv
-import os
+from status_poller import get_poller
+from aihub_client import get_client  # Shared client, created on first use
+from document_index import file_sha256, get_document_index
+from docx_questions import extract_questions, LOCAL_PARSE_ERRORS, MIN_AMBIGUOUS_TO_ASK
+from metrics import registry, span
 
-# Load environment variables from .env file
-load_dotenv()
+# Index key for questions found by the local .docx extractor (independent of the prompt)
+LOCAL_EXTRACTION_KEY = 'local-docx-extractor-v1'
 
-# Initialize the API client with the API key from .env
-client = AIHub(api_key=os.getenv("API_KEY"), api_root="https://aihub.instabase.com/api", ib_context=os.getenv("IB-CONTEXT"))
+parse_seconds = registry.histogram('parse_seconds', 'Time to find the questions in a questionnaire, by source')
+upload_seconds = registry.histogram('upload_seconds', 'Time to upload a questionnaire and wait for AIHub to process it')
+
+QUESTION_PROMPT = 'Identify all the questions in this questionnaire document and output exactly in a list format ["question 1 text", "question 2 text", etc.]. If no questions are identified, please return exactly an empty list ```[]```'
+
+def _wait_for_conversation(aihub_client, conversation_id):
+    # Wait for the conversation to finish processing
+    print("Status: Processing questionairre document...")
+    return get_poller().wait(
+        lambda: aihub_client.conversations.status(conversation_id),
+        lambda status: status.state == 'RUNNING',
+        kind='conversation'
+    )
+
+def _upload_document(aihub_client, doc_path, index):
+    # Reuse the conversation of an earlier version of the same file if there is one,
+    # so an edited document only adds itself to it instead of starting over
+    previous = index.lookup_path(doc_path) if index is not None else None
+    if previous is not None:
+        try:
+            conversation_id = previous['conversation_id']
+            known_ids = {document.id for document in aihub_client.conversations.status(conversation_id).documents}
+            aihub_client.conversations.add_documents(conversation_id, files=[doc_path])
+            status = _wait_for_conversation(aihub_client, conversation_id)
+            if status.state == 'COMPLETE':
+                new_documents = [document for document in status.documents if document.id not in known_ids]
+                if new_documents:
+                    print("Status: Added document to existing conversation ID = ", conversation_id)
+                    return conversation_id, new_documents[-1].id
+        except Exception as e:
+            print(f"Could not reuse conversation {previous['conversation_id']}, creating a new one: {e}")
 
-def parse_questionnaire(doc_path):
     # Create a conversation and upload the document
-    conversation = client.conversations.create(
+    conversation = aihub_client.conversations.create(
         name='Questionnaire Conversation',
         description='Conversation for parsing questionnaire',
         files=[doc_path]
     )
     # Get the conversation ID
     conversation_id = conversation.id
-    
-    # Check the status of the conversation
-    status = client.conversations.status(conversation_id)
-    
-    # Wait for the conversation to finish processing
-    while status.state == 'RUNNING':
-        print("Status: Processing questionairre document...")
-        time.sleep(5)
-        status = client.conversations.status(conversation_id)
+    status = _wait_for_conversation(aihub_client, conversation_id)
     
     # Check if processing was successful
-    if status.state == 'COMPLETE':
-        print("Status: Processing complete. Conversation ID = ", conversation_id)
-        # Pull in the document ID
-        document_id = status.documents[0].id
-        
-        # Prepare the prompt for querying
-        prompt = 'Identify upto 10 questions in this questionnaire document and output exactly in a list format ["question 1 text", "question 2 text", etc.]. If no questions are identified, please return exactly an empty list ```[]```'
-        
-        # Query the document
+    if status.state != 'COMPLETE':
+        raise ValueError("Error: The conversation could not be processed.")
+    print("Status: Processing complete. Conversation ID = ", conversation_id)
+    # Pull in the document ID
+    return conversation_id, status.documents[0].id
+
+def parse_question_list(answer):
+    # The model may wrap the list in a ```python/```json fence
+    text = answer.strip().strip('`').strip()
+    for prefix in ('python', 'json'):
+        if text.startswith(prefix):
+            text = text[len(prefix):].strip()
+    try:
+        questions = ast.literal_eval(text)
+    except Exception as e:
+        raise ValueError(f"Error: Failed to parse the answer. {str(e)}")
+    if not isinstance(questions, list):
+        raise ValueError("Error: The answer is not a valid list.")
+    return questions
+
+def _conversation_for(doc_path, sha256, aihub_client, index):
+    # Conversation and document holding this exact file, uploading it only if needed
+    uploaded = index.lookup(sha256) if index is not None else None
+    if uploaded is not None:
+        return uploaded['conversation_id'], uploaded['document_id'], True
+    with upload_seconds.time(), span('upload', path=doc_path, sha256=sha256):
+        conversation_id, document_id = _upload_document(aihub_client, doc_path, index)
+    if index is not None:
+        index.record(sha256, doc_path, conversation_id, document_id)
+    return conversation_id, document_id, False
+
+def _parse_docx_locally(doc_path, sha256, aihub_client, index):
+    # The conversation is only created if some lines need the LLM to decide. Chunks are
+    # classified on several threads, so the lock makes sure it is uploaded (or fails) once
+    conversation = []
+    upload_error = []
+    lock = threading.Lock()
+
+    def ask(prompt):
+        client = aihub_client or get_client()
+        with lock:
+            if upload_error:
+                raise upload_error[0]
+            if not conversation:
+                try:
+                    conversation.extend(_conversation_for(doc_path, sha256, client, index)[:2])
+                except Exception as e:
+                    upload_error.append(e)
+                    raise
         answer = client.conversations.converse(
+            conversation_id=conversation[0],
+            question=prompt,
+            document_ids=[conversation[1]]
+        )
+        return parse_question_list(answer.answer)
+
+    # A document AIHub already has costs nothing extra to ask about, however few lines are ambiguous
+    uploaded = index is not None and index.lookup(sha256) is not None
+    return extract_questions(doc_path, ask_fn=ask, min_ambiguous=1 if uploaded else MIN_AMBIGUOUS_TO_ASK)
+
+def parse_questionnaire(doc_path, prompt=QUESTION_PROMPT, aihub_client=None, index=None, use_index=True, local=True, sha256=None):
+    # sha256 can be passed when the caller already knows it (e.g. a content-addressed upload)
+    if use_index and index is None:
+        index = get_document_index()
+    started = time.perf_counter()
+    with span('parse', path=doc_path) as current:
+        questions, source = _parse_questionnaire(doc_path, prompt, aihub_client, index, local, sha256)
+        current.attributes.update(source=source, questions=len(questions))
+    parse_seconds.observe(time.perf_counter() - started, source=source)
+    return questions
+
+def _parse_questionnaire(doc_path, prompt, aihub_client, index, local, sha256=None):
+    # Returns the questions and where they came from ('index', 'local' or 'aihub')
+
+    # Unchanged documents are answered from the local index without any upload
+    sha256 = sha256 or file_sha256(doc_path)
+    if index is not None:
+        questions = index.questions(sha256, prompt)
+        if questions is None and local:
+            questions = index.questions(sha256, LOCAL_EXTRACTION_KEY)
+        if questions is not None:
+            print("Status: Questionnaire unchanged, reusing previously parsed questions")
+            return questions, 'index'
+
+    # .docx files are parsed locally; the whole document only goes to the LLM
+    # if the local extractor finds nothing at all
+    if local and doc_path.lower().endswith('.docx'):
+        try:
+            questions = _parse_docx_locally(doc_path, sha256, aihub_client, index)
+        except LOCAL_PARSE_ERRORS as e:
+            print(f"Could not read the document locally, falling back to AIHub: {e}")
+            questions = None
+        if questions:
+            print(f"Status: Found {len(questions)} questions locally")
+            if index is not None:
+                index.record_questions(sha256, LOCAL_EXTRACTION_KEY, questions)
+            return questions, 'local'
+
+    aihub_client = aihub_client or get_client()
+    conversation_id, document_id, reused = _conversation_for(doc_path, sha256, aihub_client, index)
+
+    # Query the document
+    try:
+        answer = aihub_client.conversations.converse(
             conversation_id=conversation_id,
             question=prompt,
             document_ids=[document_id]
         )
-        
-        print("Found the following questions", answer)
+    except Exception as e:
+        # Only a conversation AIHub no longer has (e.g. deleted) is worth a new upload;
+        # outages, timeouts and an open circuit leave the index entry alone
+        if not reused or getattr(e, 'status', None) != 404:
+            raise
+        index.forget(sha256)
+        return _parse_questionnaire(doc_path, prompt, aihub_client, index, local=False, sha256=sha256)
+    
+    print("Found the following questions", answer)
 
-        # Parse the answer into a list of questions
-        try:
-            questions = eval(answer.answer)
-            if not isinstance(questions, list):
-                raise ValueError("Error: The answer is not a valid list.")
-        except Exception as e:
-            raise ValueError(f"Error: Failed to parse the answer. {str(e)}")
+    # Parse the answer into a list of questions
+    questions = parse_question_list(answer.answer)
+    if index is not None:
+        index.record_questions(sha256, prompt, questions)
 
-        # Return the list of questions
-        return questions
-    else:
-        raise ValueError("Error: The conversation could not be processed.")
+    # Return the list of questions
+    return questions, 'aihub'
@@ -0,0 +1,163 @@
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+import heapq
+import itertools
+import random
+import threading
+import time
+from aihub_client import CircuitOpenError, is_transient
+from metrics import registry
+
+# Polling starts fast and backs off exponentially up to MAX_INTERVAL seconds
+INITIAL_INTERVAL = 0.5
+MAX_INTERVAL = 10.0
+BACKOFF_FACTOR = 1.6
+JITTER = 0.2  # +/- fraction of the interval, so many polls don't line up
+DEFAULT_DEADLINE = 15 * 60  # Give up on anything still running after 15 minutes
+STATUS_WORKERS = 4  # Status calls issued in parallel by the poller
+
+status_polls = registry.counter('status_polls_total', 'Status calls issued by the poller')
+polls_per_request = registry.histogram('status_polls_per_request', 'Status calls needed before a request finished',
+                                       buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55))
+
+class PollTimeoutError(TimeoutError):
+    pass
+
+class StatusPoller:
+    # One background loop that polls many outstanding queries/conversations.
+    # Callers get a Future back instead of sleeping in their own thread.
+    def __init__(self, initial_interval=INITIAL_INTERVAL, max_interval=MAX_INTERVAL, backoff_factor=BACKOFF_FACTOR,
+                 jitter=JITTER, deadline=DEFAULT_DEADLINE, workers=STATUS_WORKERS):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.deadline = deadline
+        self.workers = workers
+        self.status_calls = 0
+        self._heap = []
+        self._order = itertools.count()  # Tie breaker for entries due at the same time
+        self._cond = threading.Condition()
+        self._executor = None
+        self._thread = None
+
+    def track(self, check_fn, is_running, result_fn=None, deadline=None, kind='request'):
+        # check_fn() fetches the current status, is_running(status) decides whether to keep
+        # polling and result_fn(status) turns the final status into the Future's result.
+        # kind labels the poll metrics (e.g. 'query' or 'conversation')
+        future = Future()
+        now = time.monotonic()
+        entry = {
+            'check_fn': check_fn,
+            'is_running': is_running,
+            'result_fn': result_fn,
+            'future': future,
+            'kind': kind,
+            'polls': 0,
+            'interval': self.initial_interval,
+            'deadline': now + (self.deadline if deadline is None else deadline),
+        }
+        self._schedule(entry, now + self._jittered(self.initial_interval))
+        return future
+
+    def call_later(self, delay, fn):
+        # Runs fn() once after delay seconds on the poller's workers, sharing its timer
+        # thread instead of starting one per call. Cancelling the Future skips the call.
+        future = Future()
+        self._schedule({'call': fn, 'future': future}, time.monotonic() + delay)
+        return future
+
+    def wait(self, check_fn, is_running, result_fn=None, deadline=None, kind='request'):
+        return self.track(check_fn, is_running, result_fn, deadline, kind).result()
+
+    def _jittered(self, interval):
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _schedule(self, entry, due):
+        with self._cond:
+            if self._thread is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='status-poller')
+                self._thread = threading.Thread(target=self._run, name='status-poller', daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (due, next(self._order), entry))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, _, entry = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                if 'call' in entry:
+                    if entry['future'].cancelled():
+                        continue
+                else:
+                    self.status_calls += 1
+            self._executor.submit(self._call if 'call' in entry else self._check, entry)
+
+    def _call(self, entry):
+        future = entry['future']
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(entry['call']())
+        except BaseException as e:
+            future.set_exception(e)
+
+    def _reschedule(self, entry):
+        # Polls again after the next backoff interval; False once the deadline has passed
+        now = time.monotonic()
+        if now >= entry['deadline']:
+            return False
+        entry['interval'] = min(entry['interval'] * self.backoff_factor, self.max_interval)
+        self._schedule(entry, min(now + self._jittered(entry['interval']), entry['deadline']))
+        return True
+
+    def _check(self, entry):
+        future = entry['future']
+        if future.cancelled():
+            return  # Nobody is waiting for this any more
+        entry['polls'] += 1
+        status_polls.inc(kind=entry['kind'])
+        try:
+            try:
+                status = entry['check_fn']()
+            except Exception as e:
+                # The request is still running on AIHub even if it can't be reached right now
+                # (outage, open circuit), so keep polling with backoff until the deadline
+                if not (isinstance(e, CircuitOpenError) or is_transient(e)):
+                    raise
+                if not self._reschedule(entry):
+                    raise PollTimeoutError("Error: Timed out waiting for the request to finish.") from e
+                return
+            if entry['is_running'](status):
+                if not self._reschedule(entry):
+                    raise PollTimeoutError("Error: Timed out waiting for the request to finish.")
+                return
+            result = entry['result_fn'](status) if entry['result_fn'] is not None else status
+            error = None
+        except BaseException as e:
+            result, error = None, e
+        polls_per_request.observe(entry['polls'], kind=entry['kind'])
+        try:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        except InvalidStateError:
+            pass  # Cancelled while the status call was in flight
+
+_poller = None
+_poller_lock = threading.Lock()
+
+def get_poller():
+    # Process-wide poller shared by the CLI modules and the Flask server
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = StatusPoller()
+        return _poller
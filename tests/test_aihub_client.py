@@ -0,0 +1,86 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aihub_client import CallLimit, CircuitBreaker, CircuitOpenError, ResilientAIHub, RetryPolicy, TokenBucket, size_connection_pool
+
+class ApiError(Exception):
+    def __init__(self, status):
+        super().__init__(f'({status})')
+        self.status = status
+
+class ScriptedQueries:
+    # queries.status raises or returns the scripted outcomes in order
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+
+    def _next(self):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def status(self, query_id):
+        return self._next()
+
+    def run(self, query):
+        return self._next()
+
+def make_client(outcomes, breaker=None, max_attempts=1):
+    client = SimpleNamespace(queries=ScriptedQueries(outcomes), conversations=SimpleNamespace())
+    return ResilientAIHub(client, limiter=TokenBucket(1000, 1000), breaker=breaker or CircuitBreaker(),
+                          retry=RetryPolicy(max_attempts=max_attempts, base_delay=0), call_limit=CallLimit(4))
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_non_transient_error_ends_half_open_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        client = make_client([ApiError(503), ApiError(400), 'COMPLETE'], breaker)
+        with self.assertRaises(ApiError):
+            client.queries.run('question')  # Transient failure opens the breaker
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(ApiError) as raised:
+            client.queries.run('question')  # Half-open trial fails with a non-transient error
+        self.assertEqual(raised.exception.status, 400)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(client.queries.run('question'), 'COMPLETE')
+
+    def test_open_breaker_rejects_new_queries(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        client = make_client([ApiError(503)], breaker)
+        with self.assertRaises(ApiError):
+            client.queries.run('question')
+        with self.assertRaises(CircuitOpenError):
+            client.queries.run('question')
+
+    def test_open_breaker_still_lets_status_polls_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        client = make_client([ApiError(503), 'RUNNING'], breaker)
+        with self.assertRaises(ApiError):
+            client.queries.run('question')
+        self.assertEqual(client.queries.status('q'), 'RUNNING')
+
+class RetryTest(unittest.TestCase):
+    def test_idempotent_calls_retry_transient_errors(self):
+        client = make_client([ApiError(503), 'COMPLETE'], max_attempts=3)
+        self.assertEqual(client.queries.status('q'), 'COMPLETE')
+
+    def test_non_idempotent_calls_are_not_retried_after_server_errors(self):
+        client = make_client([ApiError(503), 'q1'], max_attempts=3)
+        with self.assertRaises(ApiError):
+            client.queries.run('question')
+        self.assertEqual(client.client.queries.outcomes, ['q1'])
+
+    def test_non_idempotent_calls_retry_when_throttled(self):
+        client = make_client([ApiError(429), 'q1'], max_attempts=3)
+        self.assertEqual(client.queries.run('question'), 'q1')
+
+class ConnectionPoolTest(unittest.TestCase):
+    def test_sizes_the_sdk_configuration(self):
+        configuration = SimpleNamespace(connection_pool_maxsize=4)
+        size_connection_pool(SimpleNamespace(client=SimpleNamespace(configuration=configuration)), 32)
+        self.assertEqual(configuration.connection_pool_maxsize, 32)
+
+if __name__ == '__main__':
+    unittest.main()
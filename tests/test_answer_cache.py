@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from answer_cache import AnswerCache, normalize_question
+
+class NormalizeQuestionTest(unittest.TestCase):
+    def test_strips_delimited_numbering(self):
+        for question in ('1. Do you encrypt data?', '1) Do you encrypt data?', '(1) Do you encrypt data?',
+                         'Q1: Do you encrypt data?', 'Q1 Do you encrypt data?', 'Question 12 - Do you encrypt data?',
+                         '3.2 Do you encrypt data?', '3.2. do you encrypt data?', '  do  you ENCRYPT data ?'):
+            self.assertEqual(normalize_question(question), 'do you encrypt data', question)
+
+    def test_keeps_numbers_that_are_part_of_the_question(self):
+        self.assertEqual(normalize_question('10 users supported?'), '10 users supported')
+        self.assertEqual(normalize_question('100 users supported?'), '100 users supported')
+        self.assertEqual(normalize_question('24 hour support available?'), '24 hour support available')
+        self.assertEqual(normalize_question('24-hour support available?'), '24-hour support available')
+        self.assertEqual(normalize_question('1.5 million users?'), '1.5 million users')
+        self.assertNotEqual(normalize_question('Q3 revenue?'), normalize_question('Q4 revenue?'))
+
+class AnswerCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = AnswerCache(os.path.join(self.dir.name, 'answers.sqlite3'))
+
+    def tearDown(self):
+        self.cache._conn.close()
+        self.dir.cleanup()
+
+    def test_numbered_variants_share_an_answer(self):
+        self.cache.put('bot', '1. Do you encrypt data?', 'model', 'Yes')
+        self.assertEqual(self.cache.get('bot', 'Q7: do you encrypt data', 'model'), 'Yes')
+
+    def test_different_quantities_do_not(self):
+        self.cache.put('bot', '10 users supported?', 'model', 'Yes')
+        self.assertIsNone(self.cache.get('bot', '100 users supported?', 'model'))
+
+if __name__ == '__main__':
+    unittest.main()
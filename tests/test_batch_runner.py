@@ -0,0 +1,81 @@
+import csv
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import batch_runner
+from output_handler import CsvStream
+
+DOCUMENTS = {
+    'a.docx': ['Do you encrypt data at rest?', 'What is requirement 4?'],
+    'b.docx': ['Do you support SSO?', 'What is requirement 5?'],
+    'c.docx': ['Do you encrypt data at rest?', 'Where is data hosted?'],
+}
+
+def answered(question, chatbot_link):
+    future = Future()
+    future.set_result(f'Answer: {question}')
+    return future
+
+class CountingStream(CsvStream):
+    open_now = 0
+    most_open = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        CountingStream.open_now += 1
+        CountingStream.most_open = max(CountingStream.most_open, CountingStream.open_now)
+
+    def close(self):
+        super().close()
+        CountingStream.open_now -= 1
+
+class RunBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.paths = [os.path.join(self.dir.name, name) for name in DOCUMENTS]
+        self.output_dir = os.path.join(self.dir.name, 'out')
+        CountingStream.open_now = CountingStream.most_open = 0
+        patches = [mock.patch.object(batch_runner, 'parse_questionnaire', lambda path, use_index=True: DOCUMENTS[os.path.basename(path)]),
+                   mock.patch.object(batch_runner, 'CsvStream', CountingStream)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_batch(self, **kwargs):
+        return batch_runner.run_batch(self.paths, 'https://aihub.example.com/hub/apps/bot', output_dir=self.output_dir,
+                                      submit_fn=answered, **kwargs)
+
+    def rows(self, name):
+        with open(os.path.join(self.output_dir, name)) as f:
+            return list(csv.reader(f))[1:]
+
+    def test_shared_questions_are_asked_once_and_streams_closed_as_documents_finish(self):
+        summary = self.run_batch()
+        self.assertEqual(summary['queried'], 5)
+        self.assertEqual(self.rows('c.csv')[0], ['Do you encrypt data at rest?', 'Answer: Do you encrypt data at rest?', ''])
+        self.assertEqual(CountingStream.open_now, 0)
+        self.assertLess(CountingStream.most_open, len(DOCUMENTS))
+
+    def test_resume_rewrites_finished_documents_without_asking_again(self):
+        self.run_batch()
+        summary = self.run_batch(resume=True)
+        self.assertEqual(summary['queried'], 0)
+        self.assertEqual(len(self.rows('b.csv')), 2)
+        self.assertEqual(CountingStream.open_now, 0)
+
+    def test_existing_file_with_glob_characters_is_not_a_batch(self):
+        path = os.path.join(self.dir.name, 'RFP [final].docx')
+        open(path, 'w').close()
+        self.assertFalse(batch_runner.is_batch(path))
+        self.assertTrue(batch_runner.is_batch(os.path.join(self.dir.name, '*.docx')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from docx_questions import AMBIGUOUS, NOT_QUESTION, QUESTION, classify_blocks, classify_row, extract_questions
+
+def paragraph(text, numbered=False, style=None):
+    return 'paragraph', text, numbered, style
+
+def write_docx(path, paragraphs):
+    body = ''.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs)
+    with zipfile.ZipFile(path, 'w') as docx:
+        docx.writestr('word/document.xml', '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                                           f'<w:body>{body}</w:body></w:document>')
+
+class ClassifyBlocksTest(unittest.TestCase):
+    def test_questions_instructions_and_headings(self):
+        classified = classify_blocks([
+            paragraph('Security', style='Heading1'),
+            paragraph('Do you encrypt data at rest?'),
+            paragraph('Describe your backup strategy.'),
+            paragraph('This document describes our requirements.'),
+        ])
+        self.assertEqual([kind for kind, _ in classified], [NOT_QUESTION, QUESTION, QUESTION, NOT_QUESTION])
+        self.assertEqual(classified[1][1], 'Do you encrypt data at rest?')
+
+    def test_label_followed_by_an_empty_paragraph_is_a_form_field(self):
+        classified = classify_blocks([paragraph('Vendor Name:'), paragraph(''), paragraph('Contact email:')])
+        self.assertEqual(classified[0], (QUESTION, 'Vendor Name:'))
+        self.assertEqual(classified[2][0], AMBIGUOUS)
+
+class ClassifyRowTest(unittest.TestCase):
+    def test_question_with_an_empty_answer_cell(self):
+        self.assertEqual(classify_row(['Company name', '']), (QUESTION, 'Company name'))
+        self.assertEqual(classify_row(['1.', 'Company name', '']), (QUESTION, '1. Company name'))
+
+    def test_question_in_the_first_cell(self):
+        self.assertEqual(classify_row(['Do you support SSO?', 'Yes']), (QUESTION, 'Do you support SSO?'))
+
+    def test_header_and_empty_rows(self):
+        self.assertEqual(classify_row(['', '']), (NOT_QUESTION, None))
+        self.assertEqual(classify_row([]), (NOT_QUESTION, None))
+
+class ExtractQuestionsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'rfp.docx')
+        write_docx(self.path, ['Do you encrypt data at rest?', 'Contact email:', 'Hosting region:', 'Support hours:'])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_few_ambiguous_lines_are_kept_without_asking(self):
+        def ask(prompt):
+            raise AssertionError('should not be asked')
+
+        questions = extract_questions(self.path, ask_fn=ask, min_ambiguous=4)
+        self.assertEqual(len(questions), 4)
+
+    def test_ask_decides_ambiguous_lines(self):
+        questions = extract_questions(self.path, ask_fn=lambda prompt: [2], min_ambiguous=1)
+        self.assertEqual(questions, ['Do you encrypt data at rest?', 'Hosting region:'])
+
+    def test_a_failing_chunk_keeps_its_lines_and_the_local_questions(self):
+        def ask(prompt):
+            raise ValueError('Error: The answer is not a valid list.')
+
+        questions = extract_questions(self.path, ask_fn=ask, min_ambiguous=1)
+        self.assertEqual(questions, ['Do you encrypt data at rest?', 'Contact email:', 'Hosting region:', 'Support hours:'])
+
+if __name__ == '__main__':
+    unittest.main()
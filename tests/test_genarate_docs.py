@@ -0,0 +1,138 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api-call-server'))
+try:
+    import genarate_docs
+except ImportError:  # Needs the server's langchain dependencies
+    genarate_docs = None
+
+DOCUMENT = '<w:document><w:body><w:p><w:r><w:t>Vendor Name:</w:t></w:r></w:p><w:sectPr/></w:body></w:document>'
+
+def raw_members(data):
+    # Compression method and compressed bytes of every member, read by offset
+    members = {}
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            start = info.header_offset + 26
+            name_length = int.from_bytes(data[start:start + 2], 'little')
+            extra_length = int.from_bytes(data[start + 2:start + 4], 'little')
+            offset = info.header_offset + 30 + name_length + extra_length
+            members[info.filename] = (info.compress_type, data[offset:offset + info.compress_size])
+    return members
+
+@unittest.skipIf(genarate_docs is None, 'langchain is not installed')
+class DocxSaveTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'rfp.docx')
+        with zipfile.ZipFile(self.path, 'w') as archive:
+            archive.writestr('[Content_Types].xml', '<Types/>' * 50, compress_type=zipfile.ZIP_DEFLATED)
+            archive.writestr('word/document.xml', DOCUMENT, compress_type=zipfile.ZIP_DEFLATED)
+            archive.writestr('word/media/image1.png', b'\x89PNG' + bytes(range(256)) * 20, compress_type=zipfile.ZIP_STORED)
+            archive.writestr('word/styles-é.xml', '<w:styles/>' * 50, compress_type=zipfile.ZIP_DEFLATED, compresslevel=1)
+            archive.comment = b'kept'
+        with open(self.path, 'rb') as f:
+            self.original = f.read()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def save(self, content=None):
+        output = io.BytesIO()
+        with genarate_docs.Docx(self.path) as docx:
+            if content is not None:
+                docx.set_content_xml(content)
+            docx.save(output)
+        return output.getvalue()
+
+    def test_unmodified_save_copies_every_member_raw(self):
+        saved = self.save()
+        self.assertEqual(raw_members(saved), raw_members(self.original))
+        with zipfile.ZipFile(io.BytesIO(saved)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.comment, b'kept')
+
+    def test_only_the_modified_document_changes(self):
+        filled = DOCUMENT.replace('Vendor Name:', 'Vendor Name: Acme')
+        saved = self.save(iter([filled[:20], filled[20:]]))
+        before, after = raw_members(self.original), raw_members(saved)
+        self.assertEqual([name for name in before if before[name] != after[name]], ['word/document.xml'])
+        with zipfile.ZipFile(io.BytesIO(saved)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.read('word/document.xml').decode('utf-8'), filled)
+            self.assertEqual(archive.namelist(), zipfile.ZipFile(self.path).namelist())
+
+    def test_failed_save_leaves_the_previous_output(self):
+        output_path = os.path.join(self.dir.name, 'rfp_filled.docx')
+        with open(output_path, 'wb') as f:
+            f.write(b'previous')
+
+        def broken():
+            yield DOCUMENT[:10]
+            raise RuntimeError('boom')
+
+        with genarate_docs.Docx(self.path) as docx:
+            docx.set_content_xml(broken())
+            with self.assertRaises(RuntimeError):
+                docx.save(output_path)
+        with open(output_path, 'rb') as f:
+            self.assertEqual(f.read(), b'previous')
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ['rfp.docx', 'rfp_filled.docx'])
+
+@unittest.skipIf(genarate_docs is None, 'langchain is not installed')
+class NormalizeTest(unittest.TestCase):
+    def test_numbering_is_stripped_but_quantities_are_kept(self):
+        self.assertEqual(genarate_docs._normalize('2) Vendor name?'), 'vendor name')
+        self.assertEqual(genarate_docs._normalize('Q3: Vendor name?'), 'vendor name')
+        self.assertEqual(genarate_docs._normalize('10 users supported?'), '10 users supported')
+        self.assertNotEqual(genarate_docs._normalize('10 users supported?'), genarate_docs._normalize('100 users supported?'))
+
+FORM = ('<w:document><w:body>'
+        '<w:p><w:r><w:t>Vendor Name:</w:t></w:r></w:p><w:p/>'
+        '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>Company size?</w:t></w:r></w:p></w:tc><w:tc><w:p></w:p></w:tc></w:tr></w:tbl>'
+        '<w:p><w:r><w:t>Describe your SLA.</w:t></w:r></w:p><w:p><w:r><w:t>Pricing</w:t></w:r></w:p>'
+        '<w:sectPr/></w:body></w:document>')
+
+def answer(text):
+    return f'<w:r><w:t xml:space="preserve">{text}</w:t></w:r>'
+
+@unittest.skipIf(genarate_docs is None, 'langchain is not installed')
+class PlanEditsTest(unittest.TestCase):
+    def fill(self, qa_pairs):
+        with mock.patch.object(genarate_docs, '_locate_with_llm', return_value={}) as locate:
+            edits, unplaced = genarate_docs._plan_edits(FORM, qa_pairs)
+        return ''.join(genarate_docs._apply_edits(FORM, edits)), unplaced, locate
+
+    def test_placeholder_paragraph_is_reused(self):
+        filled, unplaced, locate = self.fill([('Vendor Name', 'Acme')])
+        self.assertIn(f'<w:t>Vendor Name:</w:t></w:r></w:p><w:p>{answer("Acme")}</w:p><w:tbl>', filled)
+        self.assertEqual(unplaced, 0)
+        locate.assert_not_called()
+
+    def test_empty_cell_in_the_same_row_is_filled(self):
+        filled, _, _ = self.fill([('Company size?', '500 people')])
+        self.assertIn(f'<w:tc><w:p>{answer("500 people")}</w:p></w:tc>', filled)
+
+    def test_answer_without_a_placeholder_gets_its_own_paragraph(self):
+        filled, _, _ = self.fill([('Describe your SLA', '99.9%')])
+        self.assertIn(f'<w:t>Describe your SLA.</w:t></w:r></w:p><w:p>{answer("99.9%")}</w:p><w:p><w:r><w:t>Pricing', filled)
+
+    def test_unlocated_questions_are_appended_before_the_section_properties(self):
+        filled, unplaced, locate = self.fill([('Vendor Name:', 'Acme'), ('Do you offer on-call support?', 'Yes')])
+        self.assertEqual(unplaced, 1)
+        locate.assert_called_once()
+        self.assertTrue(filled.endswith(f'<w:p>{answer("Do you offer on-call support?")}</w:p><w:p>{answer("Yes")}</w:p>'
+                                        '<w:sectPr/></w:body></w:document>'))
+
+    def test_answers_are_escaped(self):
+        filled, _, _ = self.fill([('Vendor Name:', 'A & B <Ltd>')])
+        self.assertIn('A &amp; B &lt;Ltd&gt;', filled)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aihub_client import CircuitOpenError
+from knowledge_base_query import BatchingSubmitter, HedgePolicy, submit_query
+
+CHATBOT_LINK = 'https://aihub.example.com/hub/apps/chatbot-1'
+
+class OpenCircuitQueries:
+    # The batch query fails on AIHub, then the breaker is open when it is retried
+    def __init__(self):
+        self.runs = 0
+
+    def run(self, **kwargs):
+        self.runs += 1
+        if self.runs > 1:
+            raise CircuitOpenError('Error: AIHub circuit is open.')
+        return SimpleNamespace(query_id=f'q{self.runs}')
+
+    def status(self, query_id):
+        return SimpleNamespace(status='FAILED', error='overloaded')
+
+class ModelQueries:
+    # Queries for the main model never finish; the lighter hedge model answers
+    def run(self, query, model_name, **kwargs):
+        return SimpleNamespace(query_id=model_name)
+
+    def status(self, query_id):
+        if query_id == 'main':
+            return SimpleNamespace(status='RUNNING')
+        return SimpleNamespace(status='COMPLETE', results=[SimpleNamespace(response='lite answer')])
+
+class RecordingCache:
+    def __init__(self):
+        self.puts = []
+
+    def get(self, chatbot_id, question, model_name):
+        return None
+
+    def put(self, chatbot_id, question, model_name, answer):
+        self.puts.append((model_name, answer))
+
+class BrokenCache:
+    def get(self, chatbot_id, question, model_name):
+        return None
+
+    def put(self, chatbot_id, question, model_name, answer):
+        raise OSError('database is locked')
+
+class AnsweringQueries:
+    def __init__(self, response='answer'):
+        self.response = response
+
+    def run(self, **kwargs):
+        return SimpleNamespace(query_id='q1')
+
+    def status(self, query_id):
+        return SimpleNamespace(status='COMPLETE', results=[SimpleNamespace(response=self.response)])
+
+class CacheFailureTest(unittest.TestCase):
+    def test_answer_is_returned_when_the_cache_cannot_be_written(self):
+        future = submit_query('Q?', CHATBOT_LINK, SimpleNamespace(queries=AnsweringQueries()), cache=BrokenCache())
+        self.assertEqual(future.result(timeout=5), 'answer')
+
+    def test_batch_answers_are_returned_when_the_cache_cannot_be_written(self):
+        queries = AnsweringQueries('{"1": "A1", "2": "A2"}')
+        submit = BatchingSubmitter(max_questions=2, linger=60, aihub_client=SimpleNamespace(queries=queries), cache=BrokenCache())
+        futures = [submit(question, CHATBOT_LINK) for question in ('Q1?', 'Q2?')]
+        self.assertEqual([future.result(timeout=5) for future in futures], ['A1', 'A2'])
+
+class HedgeTest(unittest.TestCase):
+    def test_hedge_answer_is_cached_under_the_model_that_gave_it(self):
+        hedge = HedgePolicy(budget=1.0, model_name='lite', min_samples=1)
+        hedge.record(0.01)
+        cache = RecordingCache()
+        future = submit_query('Q?', CHATBOT_LINK, SimpleNamespace(queries=ModelQueries()), cache=cache, model_name='main', hedge=hedge)
+        self.assertEqual(future.result(timeout=5), 'lite answer')
+        self.assertEqual(cache.puts, [('lite', 'lite answer')])
+
+class BatchingSubmitterTest(unittest.TestCase):
+    def test_open_circuit_fails_the_pack_without_single_retries(self):
+        queries = OpenCircuitQueries()
+        submit = BatchingSubmitter(max_questions=3, linger=60, aihub_client=SimpleNamespace(queries=queries), retries=1)
+        futures = [submit(question, CHATBOT_LINK) for question in ('Q1?', 'Q2?', 'Q3?')]
+        for future in futures:
+            self.assertIsInstance(future.exception(timeout=5), CircuitOpenError)
+        self.assertEqual(queries.runs, 2)
+        self.assertEqual(submit.single_queries, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from output_handler import CsvStream
+
+class CsvStreamResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.dir.name, 'out.csv')
+        self.checkpoint = self.output + '.checkpoint.jsonl'
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_partial_last_line_is_dropped_before_appending(self):
+        questions = ['Q1?', 'Q2?', 'Q3?']
+        with open(self.checkpoint, 'w') as f:
+            f.write(json.dumps({'question': 'Q1?', 'answer': 'A1', 'error': None, 'index': 0}) + '\n')
+            f.write('{"question": "Q2?", "ans')  # Interrupted mid-write
+        stream = CsvStream(questions, self.output, resume=True)
+        self.assertEqual(list(stream.completed), [0])
+        stream.add(1, {'question': 'Q2?', 'answer': 'A2', 'error': None})
+        stream.close()
+
+        resumed = CsvStream(questions, self.output, resume=True)
+        resumed.close()
+        self.assertEqual(sorted(resumed.completed), [0, 1])
+        with open(self.checkpoint) as f:
+            self.assertEqual(len(f.read().splitlines()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from question_dedup import group_questions
+
+class GroupQuestionsTest(unittest.TestCase):
+    def test_rewordings_share_a_group_at_the_default_threshold(self):
+        questions = ['Do you encrypt data at rest?', 'Do you encrypt data in transit?', 'Describe your at-rest encryption.']
+        self.assertEqual(group_questions(questions), [[0, 2], [1]])
+
+    def test_a_higher_threshold_keeps_them_apart(self):
+        questions = ['Do you encrypt data at rest?', 'Describe your at-rest encryption.']
+        self.assertEqual(group_questions(questions, threshold=0.7), [[0], [1]])
+
+    def test_numbering_and_formatting_only_differences_are_exact_duplicates(self):
+        questions = ['1. Do you support SSO?', 'Pricing model?', '2) do you support  SSO']
+        self.assertEqual(group_questions(questions, threshold=1.0), [[0, 2], [1]])
+
+    def test_different_numbers_are_never_merged(self):
+        questions = ['What is requirement 4?', 'What is requirement 5?', '10 users supported?', '100 users supported?']
+        self.assertEqual(group_questions(questions), [[0], [1], [2], [3]])
+
+    def test_groups_chain_through_intermediate_questions(self):
+        # The first and last are too different on their own but are linked through the middle two
+        questions = ['Do you encrypt customer data at rest?', 'Do you encrypt data at rest?',
+                     'Do you encrypt data at rest and in backups?', 'Do you encrypt data at rest in backups and replicas?']
+        self.assertEqual(group_questions([questions[0], questions[3]]), [[0], [1]])
+        self.assertEqual(group_questions(questions), [[0, 1, 2, 3]])
+
+    def test_empty_and_stopword_only_questions(self):
+        self.assertEqual(group_questions([]), [])
+        self.assertEqual(group_questions(['What is it?', 'Please describe.']), [[0], [1]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from questionnaire_parser import QUESTION_PROMPT, _parse_questionnaire
+
+class ApiError(Exception):
+    def __init__(self, status):
+        super().__init__(f'({status})')
+        self.status = status
+
+class Reuploaded(Exception):
+    pass
+
+class IndexedDocument:
+    # Index that already holds a conversation for the document
+    def __init__(self):
+        self.forgotten = []
+
+    def questions(self, sha256, key):
+        return None
+
+    def lookup(self, sha256):
+        return None if self.forgotten else {'conversation_id': 'c1', 'document_id': 'd1'}
+
+    def lookup_path(self, path):
+        raise Reuploaded()
+
+    def forget(self, sha256):
+        self.forgotten.append(sha256)
+
+def client_failing_with(status):
+    def converse(**kwargs):
+        raise ApiError(status)
+    return SimpleNamespace(conversations=SimpleNamespace(converse=converse))
+
+class ReusedConversationTest(unittest.TestCase):
+    def test_outage_keeps_the_index_entry(self):
+        index = IndexedDocument()
+        with self.assertRaises(ApiError):
+            _parse_questionnaire('rfp.pdf', QUESTION_PROMPT, client_failing_with(503), index, local=False, sha256='abc')
+        self.assertEqual(index.forgotten, [])
+
+    def test_missing_conversation_is_uploaded_again(self):
+        index = IndexedDocument()
+        with self.assertRaises(Reuploaded):
+            _parse_questionnaire('rfp.pdf', QUESTION_PROMPT, client_failing_with(404), index, local=False, sha256='abc')
+        self.assertEqual(index.forgotten, ['abc'])
+
+if __name__ == '__main__':
+    unittest.main()
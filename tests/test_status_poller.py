@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aihub_client import CircuitOpenError
+from status_poller import PollTimeoutError, StatusPoller
+
+class CallLaterTest(unittest.TestCase):
+    def test_runs_after_the_delay_without_counting_a_status_call(self):
+        poller = StatusPoller()
+        started = time.monotonic()
+        self.assertEqual(poller.call_later(0.05, lambda: 'fired').result(timeout=2), 'fired')
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual(poller.status_calls, 0)
+
+    def test_cancelled_call_never_runs(self):
+        poller = StatusPoller()
+        calls = []
+        pending = poller.call_later(0.05, lambda: calls.append('late'))
+        self.assertTrue(pending.cancel())
+        poller.call_later(0.1, lambda: None).result(timeout=2)
+        self.assertEqual(calls, [])
+
+class TrackTest(unittest.TestCase):
+    def poller(self):
+        return StatusPoller(initial_interval=0.01, max_interval=0.02, jitter=0)
+
+    def test_keeps_polling_through_an_open_circuit_and_outages(self):
+        outcomes = [CircuitOpenError('open'), ConnectionResetError('reset'), 'RUNNING', 'COMPLETE']
+
+        def check():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        future = self.poller().track(check, lambda status: status == 'RUNNING')
+        self.assertEqual(future.result(timeout=2), 'COMPLETE')
+
+    def test_gives_up_at_the_deadline(self):
+        def check():
+            raise CircuitOpenError('open')
+
+        future = self.poller().track(check, lambda status: False, deadline=0.05)
+        self.assertIsInstance(future.exception(timeout=2), PollTimeoutError)
+
+    def test_other_errors_fail_straight_away(self):
+        def check():
+            raise ValueError('bad query id')
+
+        future = self.poller().track(check, lambda status: False)
+        self.assertIsInstance(future.exception(timeout=2), ValueError)
+
+if __name__ == '__main__':
+    unittest.main()